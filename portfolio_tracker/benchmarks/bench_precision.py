@@ -0,0 +1,91 @@
+import time
+import tracemalloc
+import numpy as np
+from model.simulation import simulate_checkpoints
+
+
+# Synthetic, seeded market so the benchmark needs no network
+def synthetic_params(n_assets, seed=0):
+    rng = np.random.default_rng(seed)
+    p0 = rng.uniform(20, 200, n_assets)
+    mu = rng.normal(3e-4, 1e-4, n_assets)
+    sigma = rng.uniform(0.01, 0.03, n_assets)
+    A = rng.normal(size=(n_assets, n_assets + 5))
+    C = np.corrcoef(A)
+    L = np.linalg.cholesky(C)
+    weights = np.full(n_assets, 1.0 / n_assets)
+    return p0, mu, sigma, L, weights
+
+
+class Float64Draws:
+    """
+    Generator stand-in that always draws in float64 and casts the draws
+    to the dtype asked for, so a float32 run gets the rounded float64
+    shocks of the float64 run with the same seed. Any difference between
+    the two runs is then the precision error alone.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def standard_normal(self, size=None, dtype=np.float64, out=None):
+        draws = self.rng.standard_normal(out.shape if out is not None else size)
+        if out is None:
+            return draws.astype(dtype)
+        out[...] = draws
+        return out
+
+    def standard_gamma(self, shape, size=None, dtype=np.float64):
+        return self.rng.standard_gamma(shape, size).astype(dtype)
+
+    def spawn(self, n):
+        return [Float64Draws(rng) for rng in self.rng.spawn(n)]
+
+
+def run(precision, dist, n_assets, years, paths, seed, same_draws=False):
+    p0, mu, sigma, L, weights = synthetic_params(n_assets)
+    rng = np.random.default_rng(seed)
+    if same_draws:
+        rng = Float64Draws(rng)
+    tracemalloc.start()
+    start = time.perf_counter()
+    finals, _ = simulate_checkpoints(p0, mu, sigma, L, weights, int(years * 252), paths, step="monthly",
+                                     dist=dist, rng=rng, precision=precision)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    var5 = np.percentile(finals, 5)
+    es5 = finals[finals <= var5].mean()
+    return elapsed, peak, var5, es5
+
+
+def main(n_assets=5, years=15, paths=20_000, seeds=(1, 2, 3)):
+    """
+    Compare wall time, peak memory and VaR/ES of float64 and float32 runs.
+    Blocks are sized by the same memory budget, so float32 fits twice the
+    paths in a block rather than lowering the peak. Time and memory come
+    from runs with their own generators; the VaR/ES drift from runs on the
+    same float64 draws, so Monte Carlo noise does not enter it.
+    """
+    print(f"{n_assets} assets, {years} years, {paths} paths, seeds {seeds}")
+    print(f"{'dist':<7} {'precision':<9} {'time (s)':>9} {'peak MB':>8} {'VaR 5%':>10} {'ES 5%':>10}")
+    for dist in ["normal", "t"]:
+        results, same = {}, {}
+        for precision in ["float64", "float32"]:
+            runs = np.array([run(precision, dist, n_assets, years, paths, s) for s in seeds])
+            results[precision] = runs.mean(axis=0)
+            same[precision] = np.array([run(precision, dist, n_assets, years, paths, s, same_draws=True)
+                                        for s in seeds])
+            elapsed, peak, var5, es5 = results[precision]
+            print(f"{dist:<7} {precision:<9} {elapsed:>9.2f} {peak / 1024 ** 2:>8.1f} {var5:>10.3f} {es5:>10.3f}")
+
+        # Largest relative VaR/ES difference over the seeds, with the shocks shared
+        ref, low = results["float64"], results["float32"]
+        drift = np.abs(same["float32"][:, 2:] / same["float64"][:, 2:] - 1).max(axis=0) * 100
+        print(f"{dist:<7} precision error: VaR {drift[0]:.2e}%, ES {drift[1]:.2e}%, "
+              f"speed-up {ref[0] / low[0]:.2f}x, memory {low[1] / ref[1]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import sys
+import time
+import numpy as np
+from benchmarks.bench_precision import synthetic_params
+from model.simulation import batch_errors, simulate_terminal, simulate_terminal_exact
+
+# Largest difference between the samplers, in combined standard errors, that still counts as agreement
+TOLERANCE = 3.0
+
+
+def run(exact, n_assets, years, paths, seed, batches=20):
+    """VaR, ES and their standard errors of one sampler, with the wall time."""
+    p0, mu, sigma, L, weights = synthetic_params(n_assets)
+    days = int(years * 252)
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    if exact:
+        finals = simulate_terminal_exact(p0, mu, sigma, L, days, paths, rng=rng)
+    else:
+        finals = simulate_terminal(p0, mu, sigma, L, days, paths, rng=rng)
+    elapsed = time.perf_counter() - start
+
+    values = (finals * weights).sum(axis=1)
+    var5 = np.percentile(values, 5)
+    es5 = values[values <= var5].mean()
+    se = batch_errors(values, paths // batches)
+    return {"time": elapsed, "var5": var5, "es5": es5, "se_var5": se["var5"], "se_es5": se["es5"]}
+
+
+def main(n_assets=5, horizons=(1, 5), paths=20_000, seed=1, tolerance=TOLERANCE):
+    """
+    Check that the exact sampler and the path-wise one give the same VaR
+    and ES for normal shocks. They draw different random numbers, so the
+    check allows `tolerance` combined standard errors of difference. Exits
+    with status 1 when a horizon is outside it, so it can run as a CI check.
+    """
+    print(f"{n_assets} assets, {paths} paths, seed {seed}, tolerance {tolerance:g} standard errors")
+    print(f"{'years':>5} {'stat':<4} {'exact':>10} {'paths':>10} {'diff / se':>10}")
+    failed = []
+    for years in horizons:
+        exact = run(True, n_assets, years, paths, seed)
+        walked = run(False, n_assets, years, paths, seed + 1)
+        for stat in ["var5", "es5"]:
+            se = np.hypot(exact[f"se_{stat}"], walked[f"se_{stat}"])
+            z = (exact[stat] - walked[stat]) / se
+            print(f"{years:>5g} {stat:<4} {exact[stat]:>10.3f} {walked[stat]:>10.3f} {z:>+10.2f}")
+            if abs(z) > tolerance:
+                failed.append(f"{stat} at {years:g} years")
+        print(f"{years:>5g} time {exact['time']:>9.3f}s {walked['time']:>9.3f}s")
+
+    if failed:
+        print(f"samplers disagree: {', '.join(failed)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Seconds the menu may take to open and show the portfolio
+BUDGET = 0.5
+
+# Modules that only the analyses and charts need, so they must not load at startup
+DEFERRED = ("pandas", "matplotlib", "scipy", "seaborn", "yfinance")
+
+# Open the menu on a database and data folders in `folder`, view the portfolio and
+# report which deferred modules got loaded
+SCRIPT = """
+import json, sys
+from pathlib import Path
+from controller.main_controller import Controller
+from model.portfolio import Portfolio
+from view.display import Display
+folder = Path({folder!r})
+app = Controller(Portfolio(db_path=folder / "portfolio.db", history_dir=folder / "history",
+                           results_dir=folder / "simulations"))
+Display().show_portfolio(app.portfolio.read_portfolio())
+loaded = [m for m in {deferred!r} if m in sys.modules]
+print(json.dumps(loaded), file=sys.stderr)
+"""
+
+
+def measure(runs):
+    """
+    Return the wall times of `runs` fresh interpreters and the deferred
+    modules they loaded. The database and data folders are temporary, so
+    the user's data folder is not touched.
+    """
+    env = dict(os.environ, PORTFOLIO_PROVIDER="stub")
+    times, loaded = [], set()
+    with tempfile.TemporaryDirectory() as folder:
+        env["PORTFOLIO_STUB_DIR"] = folder
+        script = SCRIPT.format(folder=folder, deferred=DEFERRED)
+        for _ in range(runs):
+            start = time.perf_counter()
+            done = subprocess.run([sys.executable, "-c", script], cwd=ROOT,
+                                  env=env, capture_output=True, text=True, check=True)
+            times.append(time.perf_counter() - start)
+            loaded.update(json.loads(done.stderr.strip().splitlines()[-1]))
+    return times, sorted(loaded)
+
+
+def main(runs=5, budget=BUDGET):
+    """
+    Time starting the application up to "View portfolio", including the
+    interpreter itself. Exits with status 1 when the median is over the
+    budget or a deferred module was loaded, so it can run as a CI check.
+    """
+    times, loaded = measure(runs)
+    median = sorted(times)[len(times) // 2]
+    print(f"startup to portfolio view: median {median:.3f}s, best {min(times):.3f}s over {runs} runs "
+          f"(budget {budget:.2f}s)")
+    if loaded:
+        print(f"loaded at startup but should be deferred: {', '.join(loaded)}")
+    return 0 if median <= budget and not loaded else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
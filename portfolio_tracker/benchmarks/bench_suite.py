@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from model.holdings_table import HoldingsTable
+from model.market_data import MarketDataProvider
+from model.portfolio import Portfolio
+from model.watch import LiveValuation
+
+RESULTS = Path(__file__).resolve().parent / "results"
+
+# A case is this much slower than before before it counts as a regression
+REGRESSION = 1.25
+
+# What each profile sweeps; "full" covers 1-500 assets and up to a million paths
+PROFILES = {
+    "quick": {
+        "assets": [1, 10, 50],
+        "paths": [1_000, 10_000, 100_000],
+        "years": [1, 5, 15],
+        "path_wise": [1_000, 5_000],
+        "positions": [100, 10_000],
+    },
+    "full": {
+        "assets": [1, 10, 50, 200, 500],
+        "paths": [1_000, 10_000, 100_000, 1_000_000],
+        "years": [1, 5, 15],
+        "path_wise": [1_000, 10_000, 100_000],
+        "positions": [100, 10_000, 1_000_000],
+    },
+}
+
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    Seeded price histories without a network: one market factor plus
+    Student-t noise per ticker, over six years of business days.
+    """
+
+    def __init__(self, n_assets, seed=0, years=6):
+        super().__init__()
+        rng = np.random.default_rng(seed)
+        dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=years * 252)
+
+        beta = rng.uniform(0.3, 1.2, n_assets)
+        sigma = rng.uniform(0.01, 0.03, n_assets)
+        market = rng.standard_normal((len(dates), 1))
+        noise = rng.standard_t(5, size=(len(dates), n_assets)) * np.sqrt(3 / 5)
+        returns = 2e-4 + sigma * (beta * market + noise) / np.sqrt(1 + beta ** 2)
+        prices = rng.uniform(20, 200, n_assets) * np.exp(np.cumsum(returns, axis=0))
+
+        self.tickers = [f"S{i:03d}" for i in range(n_assets)]
+        self._closes = {t: pd.Series(prices[:, i], index=dates) for i, t in enumerate(self.tickers)}
+
+    def quote(self, ticker):
+        return float(self._closes[ticker].iloc[-1])
+
+    def history(self, ticker, start, end):
+        closes = self._closes[ticker]
+        return closes[(closes.index >= pd.Timestamp(start)) & (closes.index < pd.Timestamp(end))]
+
+
+# A portfolio of n synthetic assets with its own database and history folder
+def make_portfolio(folder, n_assets, provider=None):
+    provider = provider or SyntheticProvider(n_assets)
+    new = not (folder / "portfolio.db").exists()
+    portfolio = Portfolio(provider, db_path=folder / "portfolio.db", history_dir=folder / "history")
+    if new:
+        # A new database starts from data/portfolio_data.csv, which is not what is measured
+        portfolio.clear_portfolio()
+        rows = [(t, f"Sector {i % 11}", "Equity", 10 + i % 7, 50.0) for i, t in enumerate(provider.tickers)]
+        portfolio.holdings.add_many(rows)
+    return portfolio
+
+
+def measure(fn, repeat=1):
+    """Best wall time of `repeat` calls, and the peak traced memory of one more call in MB."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak / 1024 ** 2
+
+
+def analytics_cases(sweep):
+    """summary_stats, asset_correlation and rolling_volatility by number of assets, cold and cached."""
+    for n in sweep["assets"]:
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = Path(tmp)
+            provider = SyntheticProvider(n)
+            warm = make_portfolio(folder, n, provider)
+            warm.calibrate()
+
+            calls = {
+                "summary_stats": lambda p: p.summary_stats(),
+                "asset_correlation": lambda p: p.asset_correlation(),
+                "rolling_volatility": lambda p: p.rolling_volatility(30),
+            }
+            for name, call in calls.items():
+                # Cold: a new session with the history on disk but nothing in memory
+                yield name, {"assets": n, "cache": "cold"}, lambda: call(make_portfolio(folder, n, provider))
+                call(warm)
+                yield name, {"assets": n, "cache": "warm"}, lambda: call(warm)
+
+
+def simulation_cases(sweep):
+    """
+    simulate_portfolio and simulate_fan_chart by paths, horizon, assets and
+    distribution, without the result store so every call simulates.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        portfolio = make_portfolio(folder, 10)
+        portfolio.calibrate()
+
+        for paths in sweep["paths"]:
+            params = {"assets": 10, "years": 15, "paths": paths, "dist": "normal", "method": "exact"}
+            yield "simulate_portfolio", params, lambda: portfolio.simulate_portfolio(
+                years=15, paths=paths, method="exact", seed=1, store=False)
+
+        for years in sweep["years"]:
+            for paths in sweep["path_wise"]:
+                for dist in ["normal", "t"]:
+                    params = {"assets": 10, "years": years, "paths": paths, "dist": dist, "method": "paths"}
+                    yield "simulate_portfolio", params, lambda: portfolio.simulate_portfolio(
+                        years=years, paths=paths, dist=dist, method="paths", seed=1, store=False)
+
+        # The percentile step: every path kept, or one sketch per checkpoint
+        for years in sweep["years"]:
+            for paths in sweep["path_wise"]:
+                for dist in ["normal", "t"]:
+                    for sketch in [False, True]:
+                        params = {"assets": 10, "years": years, "paths": paths, "dist": dist,
+                                  "step": "monthly", "sketch": sketch}
+                        yield "simulate_fan_chart", params, lambda: portfolio.simulate_fan_chart(
+                            years=years, paths=paths, dist=dist, step="monthly", sketch=sketch, seed=1,
+                            store=False)
+
+        # Four horizons, both distributions and a stress variant from one set of paths
+        for paths in sweep["path_wise"]:
+            params = {"assets": 10, "years": [1, 5, 10, 15], "paths": paths, "scenarios": 4}
+            yield "simulate_sweep", params, lambda: portfolio.simulate_sweep(
+                paths=paths, variants={"base": {}, "vol x1.25": {"vol": 1.25}}, seed=1, store=False)
+
+    for n in sweep["assets"]:
+        with tempfile.TemporaryDirectory() as tmp:
+            portfolio = make_portfolio(Path(tmp), n)
+            portfolio.calibrate()
+            params = {"assets": n, "years": 15, "paths": 10_000, "dist": "normal", "method": "exact"}
+            yield "simulate_portfolio", params, lambda: portfolio.simulate_portfolio(
+                years=15, paths=10_000, method="exact", seed=1, store=False)
+
+
+def watch_cases(sweep):
+    """
+    100 watch ticks of 10 price changes each, by number of positions, from
+    a replay (only the changes) and from polling (every price).
+    """
+    rng = np.random.default_rng(0)
+    for n in sweep["positions"]:
+        tickers = [f"T{i:07d}" for i in range(n)]
+        table = HoldingsTable(tickers, [f"Sector {i % 11}" for i in range(n)], ["Equity"] * n,
+                              rng.integers(1, 100, n), rng.uniform(10, 100, n))
+        live = LiveValuation(table, dict(zip(tickers, rng.uniform(10, 100, n))))
+        ticks = [{tickers[i]: p for i, p in zip(rng.integers(0, n, 10), rng.uniform(10, 100, 10))}
+                 for _ in range(100)]
+
+        def replay(live=live, ticks=ticks):
+            for quotes in ticks:
+                live.snapshot(live.apply(quotes))
+        yield "watch_ticks", {"positions": n, "ticks": 100, "changes": 10, "source": "replay"}, replay
+
+        # Polling hands over the price of every position, 10 of which moved
+        prices = live.price.copy()
+
+        def poll(live=live, ticks=ticks, prices=prices):
+            for quotes in ticks:
+                snapshot = prices.copy()
+                for ticker, price in quotes.items():
+                    snapshot[live._row[ticker]] = price
+                live.snapshot(live.apply(snapshot))
+        yield "watch_ticks", {"positions": n, "ticks": 100, "changes": 10, "source": "poll"}, poll
+
+
+def run(profile="quick", repeat=1, only=None):
+    sweep = PROFILES[profile]
+    records = []
+    for cases in (analytics_cases(sweep), simulation_cases(sweep), watch_cases(sweep)):
+        for name, params, fn in cases:
+            if only and name not in only:
+                continue
+            seconds, peak = measure(fn, repeat)
+            records.append({"bench": name, "params": params, "seconds": seconds, "peak_mb": peak})
+            print(f"{name:<20} {describe(params):<70} {seconds:>9.4f}s {peak:>9.1f} MB", flush=True)
+    return records
+
+
+def describe(params):
+    return " ".join(f"{k}={v}" for k, v in params.items())
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+# Match the cases of two result files and list the ones that got slower
+def compare(old, new):
+    before = {(r["bench"], json.dumps(r["params"], sort_keys=True)): r for r in old["results"]}
+    regressions = 0
+    print(f"\nCompared with {old['environment'].get('commit')} ({old['environment'].get('date')}):")
+    for r in new["results"]:
+        key = (r["bench"], json.dumps(r["params"], sort_keys=True))
+        if key not in before:
+            continue
+        ratio = r["seconds"] / max(before[key]["seconds"], 1e-9)
+        slower = ratio > REGRESSION and r["seconds"] - before[key]["seconds"] > 0.01
+        regressions += slower
+        mark = "  SLOWER" if slower else ""
+        print(f"{r['bench']:<20} {describe(r['params']):<70} {ratio:>6.2f}x{mark}")
+    print(f"{regressions} regression(s) over {REGRESSION:.2f}x")
+    return regressions
+
+
+def main(argv=None):
+    """
+    Time the analytics and simulations on synthetic portfolios and save the
+    results as JSON in benchmarks/results, to compare between versions.
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_suite", description=main.__doc__)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per case, the best counts")
+    parser.add_argument("--only", nargs="*", help="benchmark names to run, e.g. simulate_fan_chart")
+    parser.add_argument("--out", help="result file (default benchmarks/results/<commit>-<profile>.json)")
+    parser.add_argument("--compare", help="earlier result file; exit 1 when a case got slower")
+    args = parser.parse_args(argv)
+
+    document = {"environment": environment(), "profile": args.profile, "results": []}
+    document["results"] = run(args.profile, args.repeat, args.only)
+
+    out = Path(args.out) if args.out else RESULTS / f"{document['environment']['commit'] or 'local'}-{args.profile}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(document, indent=2) + "\n")
+    print(f"\nSaved {len(document['results'])} results to {out}")
+
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text())
+        return 1 if compare(old, document) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from model.lazy import lazy_import
+from model.portfolio import Portfolio
+from model.profiling import PROFILER, span
+from model.watch import poll_quotes, replay_quotes
+
+pd = lazy_import("pandas")
+
+
+# Shared options of every command: which portfolio to use and where the results go
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="Run the portfolio tracker without the menu. Results are printed as JSON "
+                    "unless --json or --csv name a file.",
+    )
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--db", help="holdings database (default data/portfolio.db)")
+    common.add_argument("--holdings", help="CSV file with the holdings to use instead of the database")
+    common.add_argument("--json", metavar="PATH", help="write the results as JSON ('-' for stdout)")
+    common.add_argument("--csv", metavar="PATH", help="write the results as CSV ('-' for stdout)")
+    common.add_argument("--profile", action="store_true", help="print the time per stage and counters to stderr")
+    common.add_argument("--trace", metavar="PATH", help="also write the profile as a Chrome trace JSON file")
+
+    # Only the commands that draw a chart
+    chart = argparse.ArgumentParser(add_help=False)
+    chart.add_argument("--chart", metavar="PATH", help="save a chart, PNG or SVG by the file extension")
+
+    # Options of every Monte Carlo command
+    runs = argparse.ArgumentParser(add_help=False)
+    runs.add_argument("--paths", type=int, default=100_000)
+    runs.add_argument("--df", type=degrees_of_freedom, default=5.0,
+                      help="Student-t degrees of freedom, larger than 2, or 'fit'")
+    runs.add_argument("--seed", type=int, default=None)
+    runs.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    runs.add_argument("--sampling", choices=["pseudo", "antithetic"], default="antithetic")
+    runs.add_argument("--fresh", action="store_true",
+                      help="simulate again instead of returning a stored identical run")
+    runs.add_argument("--no-store", action="store_true", help="neither read nor save data/simulations")
+
+    simulation = argparse.ArgumentParser(add_help=False, parents=[runs])
+    simulation.add_argument("--years", type=horizon, default=15)
+    simulation.add_argument("--dist", choices=["normal", "t"], default="normal")
+    simulation.add_argument("--method", choices=["exact", "paths"], default=None,
+                            help="default: exact for normal shocks, paths for Student-t")
+    simulation.add_argument("--step", choices=["daily", "weekly", "monthly"], default="monthly")
+
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summary", parents=[common], help="portfolio value and weights")
+    summary.add_argument("--refresh", action="store_true", help="fetch new quotes first")
+    commands.add_parser("simulate", parents=[common, chart, simulation], help="Monte Carlo VaR and ES")
+    commands.add_parser("fan", parents=[common, chart, simulation], help="Monte Carlo fan chart bands")
+    sweep = commands.add_parser("sweep", parents=[common, runs],
+                                help="Monte Carlo VaR and ES for several horizons and scenarios in one run")
+    sweep.add_argument("--years", type=horizon, nargs="+", default=[1, 5, 10, 15])
+    sweep.add_argument("--dists", choices=["normal", "t"], nargs="+", default=["normal", "t"])
+    sweep.add_argument("--vol", type=float, nargs="*", default=[], metavar="FACTOR",
+                       help="add a variant with the volatilities multiplied by FACTOR")
+    sweep.add_argument("--drift", type=float, nargs="*", default=[], metavar="SHIFT",
+                       help="add a variant with SHIFT added to the drift rates")
+    sweep.add_argument("--method", choices=["exact", "paths"], default="exact",
+                       help="exact steps from horizon to horizon when all shocks are normal")
+    volatility = commands.add_parser("volatility", parents=[common, chart], help="annualised volatility")
+    volatility.add_argument("--estimator", choices=["rolling", "ewma", "garch"], default="rolling")
+    volatility.add_argument("--window", type=int, default=30)
+    volatility.add_argument("--years", type=float, default=3)
+    commands.add_parser("correlation", parents=[common, chart], help="correlation matrix of daily returns")
+    watch = commands.add_parser("watch", parents=[common], help="live dashboard of values and weights")
+    watch.add_argument("--interval", type=float, default=None,
+                       help="seconds between ticks (default 5 when polling, 0 for a replay)")
+    watch.add_argument("--replay", metavar="PATH", help="read ticks from a CSV file with time,ticker,price")
+    watch.add_argument("--ticks", type=int, default=None, help="stop after this many ticks")
+    # The dashboard is the output; JSON only when --json asks for it
+    watch.set_defaults(print_json=False)
+    return parser
+
+
+# --years of a simulation: at least one trading day
+def horizon(text):
+    try:
+        years = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a number: {text!r}")
+    if not 1 / 252 <= years < np.inf:
+        raise argparse.ArgumentTypeError(f"must be at least one trading day (1/252 years): {text}")
+    return years
+
+
+# --df: "fit", or a number above 2 so the Student-t shocks have a finite variance
+def degrees_of_freedom(text):
+    if text.strip().lower() == "fit":
+        return "fit"
+    try:
+        df = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a number or 'fit': {text!r}")
+    if not 2 < df < np.inf:
+        raise argparse.ArgumentTypeError(f"must be a finite number larger than 2: {text}")
+    return df
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile or args.trace:
+        PROFILER.enable(args.trace)
+
+    with span(f"cli.{args.command}"):
+        portfolio = open_portfolio(args)
+        result = COMMANDS[args.command](portfolio, args)
+    if result is None:
+        print("No data: add assets with prices and history first.", file=sys.stderr)
+        return 1
+
+    document, table = result
+    if args.json or (not args.csv and getattr(args, "print_json", True)):
+        write_json(document, args.json or "-")
+    if args.csv:
+        write_csv(table, args.csv)
+    return 0
+
+
+def open_portfolio(args):
+    if args.holdings:
+        portfolio = Portfolio(db_path=":memory:")
+        portfolio.import_csv(args.holdings, replace=True)
+        return portfolio
+    return Portfolio(db_path=args.db)
+
+
+# Every command returns (JSON document, DataFrame for the CSV), or None without data
+def summary(portfolio, args):
+    stats = portfolio.summary_stats(refresh=args.refresh)
+    if stats is None:
+        return None
+    return stats, pd.DataFrame(stats["assets"])
+
+
+def simulate(portfolio, args):
+    settings = simulation_settings(args)
+    sim = portfolio.simulate(sketch=True, store=store_mode(args), **settings)
+    if sim is None:
+        return None
+    if args.chart:
+        from view.mc_view import MonteCarloView
+        MonteCarloView().show_histogram(sim, path=args.chart)
+
+    stats = {k: v for k, v in sim.items() if k not in ("final_values", "bands")}
+    row = {k: v for k, v in stats.items() if k not in ("se", "run", "skipped")}
+    row.update({f"se_{k}": v for k, v in (stats.get("se") or {}).items()})
+    if "run" in stats:
+        row["run_id"] = stats["run"]["id"]
+    if stats.get("skipped"):
+        row["skipped"] = " ".join(stats["skipped"])
+    return {"parameters": settings, "results": stats}, pd.DataFrame([row])
+
+
+def fan(portfolio, args):
+    settings = simulation_settings(args)
+    sim = portfolio.simulate(sketch=True, store=store_mode(args), **settings)
+    if sim is None:
+        return None
+    if args.chart:
+        from view.mc_view import MonteCarloView
+        MonteCarloView().show_fan_chart(sim["bands"], path=args.chart)
+
+    bands = pd.DataFrame(sim["bands"])
+    bands.insert(0, "years", bands.pop("days") / 252)
+    return {"parameters": settings, "bands": bands.to_dict(orient="list")}, bands
+
+
+def sweep(portfolio, args):
+    settings = sweep_settings(args)
+    result = portfolio.simulate_sweep(store=store_mode(args), **settings)
+    if result is None:
+        return None
+
+    rows = []
+    for r in result["rows"]:
+        row = {k: v for k, v in r.items() if k not in ("se", "delta", "se_delta")}
+        row.update({f"se_{k}": v for k, v in (r.get("se") or {}).items()})
+        row.update({f"delta_{k}": v for k, v in (r.get("delta") or {}).items()})
+        row.update({f"se_delta_{k}": v for k, v in (r.get("se_delta") or {}).items()})
+        rows.append(row)
+    document = {"parameters": settings, "results": {k: v for k, v in result.items() if k != "final_values"}}
+    return document, pd.DataFrame(rows)
+
+
+def volatility(portfolio, args):
+    window = args.window if args.estimator == "rolling" else None
+    vol = portfolio.volatility(args.estimator, args.window, args.years)
+    if not vol:
+        return None
+    if args.chart:
+        from view.display import Display
+        Display().show_volatility_chart(vol, window, args.estimator, path=args.chart, years=args.years)
+
+    table = pd.DataFrame(vol)
+    table.index.name = "date"
+    document = {
+        "estimator": args.estimator,
+        "window": window,
+        "dates": [d.strftime("%Y-%m-%d") for d in table.index],
+        "volatility": {t: table[t].tolist() for t in table.columns},
+    }
+    return document, table
+
+
+def correlation(portfolio, args):
+    corr = portfolio.asset_correlation()
+    if corr is None:
+        return None
+    if args.chart:
+        from view.display import Display
+        Display().show_correlation_heatmap(corr, path=args.chart)
+    return {"correlation": corr.to_dict()}, corr
+
+
+# Redraw the dashboard on every tick until the source ends, --ticks is reached or Ctrl-C
+def watch(portfolio, args):
+    live = portfolio.live_valuation()
+    if live is None:
+        return None
+    if args.replay:
+        source = replay_quotes(args.replay, args.interval or 0.0)
+    else:
+        source = poll_quotes(portfolio, live.tickers, 5.0 if args.interval is None else args.interval)
+
+    from view.watch_view import WatchView
+    view = WatchView()
+    view.show_dashboard(live.snapshot(), "start")
+    started = time.perf_counter()
+    try:
+        for stamp, quotes in source:
+            with span("tick", quotes=len(quotes)):
+                changed = live.apply(quotes)
+                view.show_dashboard(live.snapshot(changed), stamp)
+            if args.ticks and live.ticks >= args.ticks:
+                break
+    except KeyboardInterrupt:
+        pass
+
+    state = live.snapshot()
+    state["seconds"] = round(time.perf_counter() - started, 3)
+    state.pop("movers")
+    positions = pd.DataFrame({"ticker": live.tickers, "current_price": live.price, "current_value": live.value})
+    return state, positions
+
+
+COMMANDS = {
+    "summary": summary,
+    "simulate": simulate,
+    "fan": fan,
+    "sweep": sweep,
+    "volatility": volatility,
+    "correlation": correlation,
+    "watch": watch,
+}
+
+
+# The simulation options as passed to Portfolio.simulate, also written next to the results
+def simulation_settings(args):
+    return {
+        "years": args.years,
+        "paths": args.paths,
+        "dist": args.dist,
+        "df": args.df,
+        "method": args.method or ("exact" if args.dist == "normal" else "paths"),
+        "seed": args.seed,
+        "workers": args.workers,
+        "step": args.step,
+        "sampling": args.sampling,
+    }
+
+
+# The options as passed to Portfolio.simulate_sweep, with a variant per --vol factor and --drift shift
+def sweep_settings(args):
+    variants = {"base": {}}
+    variants.update({f"vol x{v:g}": {"vol": v} for v in args.vol})
+    variants.update({f"drift {d:+g}": {"drift": d} for d in args.drift})
+    return {
+        "years": args.years,
+        "dists": args.dists,
+        "variants": variants,
+        "paths": args.paths,
+        "df": args.df,
+        "method": args.method,
+        "seed": args.seed,
+        "workers": args.workers,
+        "sampling": args.sampling,
+    }
+
+
+# Portfolio.simulate's store argument for --fresh and --no-store
+def store_mode(args):
+    if args.no_store:
+        return False
+    return "refresh" if args.fresh else True
+
+
+def write_json(document, path):
+    text = json.dumps(plain(document), indent=2)
+    if path == "-":
+        print(text)
+    else:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+
+
+def write_csv(table, path):
+    index = not isinstance(table.index, pd.RangeIndex)
+    table.to_csv(sys.stdout if path == "-" else path, index=index)
+
+
+# Plain Python values for JSON: NumPy scalars and arrays converted, NaN written as null
+def plain(value):
+    if isinstance(value, dict):
+        return {str(k): plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [plain(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
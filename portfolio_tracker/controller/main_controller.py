@@ -1,16 +1,22 @@
 from model.portfolio import Portfolio
+from model.prefetch import Prefetcher
 from controller.mc_controller import MonteCarloController
+from model.profiling import span
 from view.display import Display
-import yfinance as yf
 from datetime import datetime
 
 
 class Controller:
-    def __init__(self):
-        self.portfolio = Portfolio()
+    def __init__(self, portfolio=None):
+        # A given portfolio brings its own database and data folders, as the benchmarks use
+        self.portfolio = portfolio or Portfolio()
         self.view = Display()
+        self.prefetcher = Prefetcher(self.portfolio)
 
     def run(self):
+        # Load quotes, history and the analysis libraries in the background while the menu is open
+        self.prefetcher.warm_up()
+        self.prefetcher.import_modules()
         while True:
             print("\n----- Portfolio Tracker -----")
             print("1. Add or remove an asset")
@@ -21,20 +27,23 @@ class Controller:
             print("6. Volatility Analysis")
             print("7. Asset Correlation Analysis")
             print("8. Clear portfolio")
-            print("9. Exit")
+            print("9. Refresh market prices")
+            print("10. Exit")
     
             choice = input("Choose an option: ")
     
             if choice == "1":
                 self.manage_asset()
             elif choice == "2":
-                data = self.portfolio.read_portfolio()
-                self.view.show_portfolio(data)
+                with span("menu.view_portfolio"):
+                    data = self.portfolio.read_portfolio()
+                    self.view.show_portfolio(data)
             elif choice == "3":
                 self.show_price_graph()
             elif choice == "4":
-                stats = self.portfolio.summary_stats()
-                self.view.show_portfolio_stats(stats)
+                with span("menu.calculations"):
+                    stats = self.portfolio.summary_stats()
+                    self.view.show_portfolio_stats(stats)
             elif choice == "5":
                 mc = MonteCarloController(self.portfolio)
                 mc.run()
@@ -44,8 +53,17 @@ class Controller:
                 self.show_correlation_analysis()
             elif choice == "8":
                 self.portfolio.clear_portfolio()
-                self.portfolio = Portfolio()
+                old = self.portfolio
+                self.portfolio = Portfolio(old.market, db_path=old.db_path, history_dir=old.history.folder,
+                                           results_dir=old.results.folder)
+                self.prefetcher.close()
+                self.prefetcher = Prefetcher(self.portfolio)
             elif choice == "9":
+                with span("menu.refresh_prices"):
+                    self.portfolio.quote_snapshot(refresh=True)
+                self.view.show_message("Market prices refreshed.\n")
+            elif choice == "10":
+                self.prefetcher.close()
                 print("Goodbye!")
                 break
 
@@ -55,7 +73,9 @@ class Controller:
         print("\n--- Asset Manager ---")
         print("1. Add asset")
         print("2. Delete asset")
-        print("3. Back to main menu")
+        print("3. Import from CSV")
+        print("4. Export to CSV")
+        print("5. Back to main menu")
     
         choice = input("Choose an option: ")
     
@@ -66,7 +86,7 @@ class Controller:
             ticker = input("Ticker: ").upper()
     
             try:
-                info = yf.Ticker(ticker).info
+                info = self.portfolio.market.info(ticker)
                 sector = info.get("sector", "Unknown")
                 asset_class = "Equity"  # Assume equities for now
                 current_price = round(info.get("currentPrice", 0), 2)
@@ -91,6 +111,7 @@ class Controller:
             price = current_price if current_price else float(input("Purchase price: "))
     
             self.portfolio.add_asset(ticker, sector, asset_class, quantity, price)
+            self.prefetcher.ticker_added(ticker)
             self.view.show_message(f"{ticker} added to portfolio.\n")
     
         # Delete an asset
@@ -104,8 +125,25 @@ class Controller:
             else:
                 print(f"{ticker} not found in portfolio.\n")
     
-        # Go back to menu
+        # Add the positions of a CSV file in the portfolio_data.csv layout
         elif choice == "3":
+            path = input(f"CSV file (Enter for {self.portfolio.csv_path}): ").strip() or None
+            try:
+                count = self.portfolio.import_csv(path)
+            except (OSError, KeyError, ValueError):
+                self.view.show_message("Could not read this CSV file.\n")
+                return
+            self.prefetcher.warm_up()
+            self.view.show_message(f"Imported {count} positions.\n")
+
+        # Save the positions to a CSV file
+        elif choice == "4":
+            path = input(f"CSV file (Enter for {self.portfolio.csv_path}): ").strip() or None
+            count = self.portfolio.export_csv(path)
+            self.view.show_message(f"Exported {count} positions.\n")
+
+        # Go back to menu
+        elif choice == "5":
             return
         else:
             print("Invalid option.\n")
@@ -146,7 +184,16 @@ class Controller:
             self.view.show_message("Invalid date format. Please use YYYY-MM-DD.\n")
             return
 
-        self.view.show_price_chart(selected, start_date)
+        with span("menu.price_history"):
+            histories = {}
+            for t in selected:
+                data = self.portfolio.history.close(t, start=start_date)
+                if data.empty:
+                    self.view.show_message(f"Could not fetch data for {t}")
+                else:
+                    histories[t] = data
+
+            self.view.show_price_chart(histories, start_date)
         
     def show_volatility_analysis(self):
         print("\n--- Volatility Analysis ---")
@@ -154,24 +201,43 @@ class Controller:
         print("1. 5 days")
         print("2. 30 days")
         print("3. 90 days")
+        print("4. Other number of days")
+        print("5. EWMA (RiskMetrics)")
+        print("6. GARCH(1,1)")
     
         opt = input("Enter option: ")
     
+        method = "rolling"
+        window = None
         if opt == "1":
             window = 5
         elif opt == "2":
             window = 30
         elif opt == "3":
             window = 90
+        elif opt == "4":
+            try:
+                window = int(input("Window in trading days: "))
+            except ValueError:
+                window = 0
+            if window < 2:
+                print("Invalid window.\n")
+                return
+        elif opt == "5":
+            method = "ewma"
+        elif opt == "6":
+            method = "garch"
         else:
             print("Invalid option.\n")
             return
     
-        vol = self.portfolio.rolling_volatility(window)
-        self.view.show_volatility_chart(vol, window)
+        with span("menu.volatility"):
+            vol = self.portfolio.volatility(method, window)
+            self.view.show_volatility_chart(vol, window, method)
         
     def show_correlation_analysis(self):
-        corr = self.portfolio.asset_correlation()
-        self.view.show_correlation_heatmap(corr)
+        with span("menu.correlation"):
+            corr = self.portfolio.asset_correlation()
+            self.view.show_correlation_heatmap(corr)
 
 
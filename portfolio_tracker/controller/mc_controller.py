@@ -1,10 +1,24 @@
+import os
+from model.profiling import profiled
 from view.mc_view import MonteCarloView
 
+# Horizons in years and parameter variants of the scenario sweep
+SWEEP_YEARS = (1, 5, 10, 15)
+SWEEP_VARIANTS = {
+    "base": {},
+    "vol x1.25": {"vol": 1.25},
+    "drift -2%": {"drift": -0.02},
+}
+
 
 class MonteCarloController:
     def __init__(self, portfolio):
         self.portfolio = portfolio
         self.view = MonteCarloView()
+        # Simulations are spread over all cores
+        self.workers = os.cpu_count() or 1
+        # The last run; until one is made, the newest stored run of this portfolio
+        self.sim = None
 
     def run(self):
         while True:
@@ -13,37 +27,109 @@ class MonteCarloController:
             print("2. Run Monte Carlo (Student-t distribution)")
             print("3. Show fan chart")
             print("4. Show histogram")
-            print("5. Back to main menu")
+            print("5. Compare with earlier runs")
+            print("6. Scenario sweep (horizons, distributions, stress variants)")
+            print("7. Back to main menu")
 
             choice = input("Choose an option: ")
 
             if choice == "1":
-                self.last_dist = "normal"
-                self.sim = self.portfolio.simulate_portfolio(dist="normal")
-                self.view.show_basic_results(self.sim)
+                self.run_simulation(dist="normal", method="exact")
 
             elif choice == "2":
-                self.last_dist = "t"
-                self.sim = self.portfolio.simulate_portfolio(dist="t")
-                self.view.show_basic_results(self.sim)
-
+                df = self.ask_degrees_of_freedom()
+                if df is not None:
+                    self.run_simulation(dist="t", df=df)
 
             elif choice == "3":
-                bands = self.portfolio.simulate_fan_chart(dist=getattr(self, "last_dist", "normal"))
-                if not bands:
-                    print("No data. Add assets first.")
+                if self.current() is not None:
+                    self.view.show_fan_chart(self.sim["bands"])
                 else:
-                    self.view.show_fan_chart(bands)
-            
+                    print("Run a simulation first.")
 
             elif choice == "4":
-                if hasattr(self, "sim"):
+                if self.current() is not None:
                     self.view.show_histogram(self.sim)
                 else:
                     print("Run a simulation first.")
 
             elif choice == "5":
+                self.compare_runs()
+
+            elif choice == "6":
+                df = self.ask_degrees_of_freedom()
+                if df is not None:
+                    self.run_sweep(df)
+
+            elif choice == "7":
                 return
 
             else:
                 print("Invalid choice.")
+
+    # One run feeds the results, the histogram and the fan chart
+    @profiled("menu.monte_carlo")
+    def run_simulation(self, dist, method="paths", df=5):
+        sim = self.portfolio.simulate(dist=dist, method=method, step="monthly", sketch=True,
+                                      workers=self.workers, df=df, sampling="antithetic")
+        if sim is None:
+            print("No data. Add assets first.")
+            return
+        self.sim = sim
+        self.view.show_basic_results(self.sim)
+
+    # Every horizon, distribution and variant from one run of the paths
+    @profiled("menu.sweep")
+    def run_sweep(self, df=5):
+        sweep = self.portfolio.simulate_sweep(years=SWEEP_YEARS, variants=SWEEP_VARIANTS, df=df,
+                                              workers=self.workers)
+        if sweep is None:
+            print("No data. Add assets first.")
+            return
+        self.view.show_sweep(sweep)
+
+    # The simulation to show, read back from disk after the menu was closed
+    def current(self):
+        if self.sim is None:
+            self.sim = self.portfolio.latest_simulation()
+        return self.sim
+
+    # Pick an earlier run and draw its final values next to the current ones
+    def compare_runs(self):
+        current = self.current()
+        runs = self.portfolio.results.runs()
+        runs = [h for h in runs if h["kind"] == "simulate"][:20]
+        self.view.show_runs(runs, current["run"]["key"] if current else None)
+        if not runs or current is None:
+            return
+
+        answer = input("Run to compare with (Enter to go back): ").strip()
+        if not answer:
+            return
+        try:
+            chosen = runs[int(answer) - 1]
+        except (ValueError, IndexError):
+            print("Invalid choice.")
+            return
+        other = self.portfolio.results.load(chosen["run"]["key"])
+        if other is None:
+            print("This run is no longer stored.")
+            return
+        self.view.show_comparison(current, other)
+
+    # Tail thickness of the Student-t shocks, fixed or estimated from history
+    def ask_degrees_of_freedom(self):
+        answer = input("Degrees of freedom (Enter for 5, 'fit' to estimate from history): ").strip().lower()
+        if answer == "":
+            return 5
+        if answer == "fit":
+            return "fit"
+        try:
+            df = float(answer)
+        except ValueError:
+            print("Invalid number.")
+            return None
+        if df <= 2:
+            print("Degrees of freedom must be larger than 2.")
+            return None
+        return df
@@ -1 +1 @@
-from controller.main_controller import Controllerif __name__ == "__main__":    app = Controller()    app.run()
\ No newline at end of file
+import sysif __name__ == "__main__":    # With arguments the tracker runs headless: results go to files and charts are saved, not shown    if len(sys.argv) > 1:        from view.plotting import use_backend        use_backend("Agg")        from cli import main        sys.exit(main(sys.argv[1:]))    from controller.main_controller import Controller    app = Controller()    app.run()
\ No newline at end of file
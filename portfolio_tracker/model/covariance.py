@@ -0,0 +1,190 @@
+import numpy as np
+from model.profiling import count
+
+# Above this many assets, or with fewer than SHRINK_ROWS_PER_ASSET rows per asset, "auto" shrinks
+SHRINK_ASSETS = 30
+SHRINK_ROWS_PER_ASSET = 10
+
+
+class CovarianceEstimator:
+    """
+    Running mean and covariance of a returns table (rows are days, columns
+    are assets). When the table is fitted again, rows dropped from the
+    start or added at the end, and assets added at the end, are folded in
+    without going over the other data again. Ledoit-Wolf shrinkage and the
+    Cholesky factor of the correlation matrix are cached until the data
+    changes.
+    """
+
+    def __init__(self, shrinkage="auto"):
+        # None, "ledoit-wolf", or "auto" for Ledoit-Wolf on large portfolios only
+        self.shrinkage = shrinkage
+
+        # Number of rows, column means and the matrix of co-moments around them
+        self.n = 0
+        self.mean = None
+        self._m2 = None
+
+        # The fitted table, to find what changed on the next fit
+        self._frame = None
+
+        # Bumped whenever the estimates change, with results cached per version
+        self.version = 0
+        self._cache = {}
+
+        # Rows folded in or out since the last full pass, rounding adds up with them
+        self._updates = 0
+
+    # Bring the estimates up to date with a returns DataFrame without missing values
+    def fit(self, returns):
+        """Fit to a DataFrame indexed by date with one column per asset."""
+        old = self._frame
+        if old is not None and old.shape == returns.shape and old.index.equals(returns.index) \
+                and list(old.columns) == list(returns.columns) and np.array_equal(old.values, returns.values):
+            count("covariance.unchanged")
+            return self
+
+        if self._extend_rows(old, returns) or self._extend_columns(old, returns):
+            count("covariance.updated")
+        else:
+            count("covariance.full")
+            self._full(returns.values)
+
+        self._frame = returns
+        self.version += 1
+        self._cache = {}
+        return self
+
+    def covariance(self):
+        """Sample covariance (ddof=1), shrunk when the shrinkage setting asks for it."""
+        if "covariance" not in self._cache:
+            cov = self._m2 / max(self.n - 1, 1)
+            if self._shrink():
+                cov = self._ledoit_wolf(cov)
+            self._cache["covariance"] = cov
+        return self._cache["covariance"]
+
+    def correlation(self):
+        if "correlation" not in self._cache:
+            cov = self.covariance()
+            d = np.sqrt(np.diag(cov))
+            d[d == 0] = 1.0
+            corr = cov / np.outer(d, d)
+            np.fill_diagonal(corr, 1.0)
+            self._cache["correlation"] = corr
+        return self._cache["correlation"]
+
+    # Population standard deviation per column, as np.std
+    def std(self):
+        return np.sqrt(np.diag(self._m2) / max(self.n, 1))
+
+    # Lower Cholesky factor of the correlation matrix, repaired to be positive definite if needed
+    def cholesky(self):
+        if "cholesky" not in self._cache:
+            self._cache["cholesky"] = self._psd_cholesky(self.correlation())
+        return self._cache["cholesky"]
+
+    def _full(self, X):
+        self.n = len(X)
+        self.mean = X.mean(axis=0)
+        D = X - self.mean
+        self._m2 = D.T @ D
+        self._updates = 0
+
+    # Same assets, some rows dropped at the start and some added at the end
+    def _extend_rows(self, old, new):
+        if old is None or list(old.columns) != list(new.columns) or len(new) == 0:
+            return False
+
+        start = old.index.searchsorted(new.index[0])
+        kept = len(old) - start
+        if kept <= 1 or kept > len(new) or not old.index[start:].equals(new.index[:kept]):
+            return False
+        if not np.array_equal(old.values[start:], new.values[:kept]):
+            return False
+
+        # Start over when the folded rows outnumber the data, so rounding cannot pile up
+        changed = start + len(new) - kept
+        if self._updates + changed > len(new):
+            return False
+
+        if start:
+            self._remove(old.values[:start])
+        if len(new) > kept:
+            self._add(new.values[kept:])
+        self._updates += changed
+        return True
+
+    # Same rows, assets added after the existing ones
+    def _extend_columns(self, old, new):
+        if old is None or not old.index.equals(new.index):
+            return False
+        n_old = old.shape[1]
+        if list(new.columns[:n_old]) != list(old.columns) or new.shape[1] <= n_old:
+            return False
+        if not np.array_equal(old.values, new.values[:, :n_old]):
+            return False
+
+        X = new.values[:, n_old:]
+        mean_x = X.mean(axis=0)
+        Dx = X - mean_x
+        cross = (old.values - self.mean).T @ Dx
+        self._m2 = np.block([[self._m2, cross], [cross.T, Dx.T @ Dx]])
+        self.mean = np.concatenate([self.mean, mean_x])
+        return True
+
+    # Chan et al. merge of a block of rows into the running moments
+    def _add(self, X):
+        m = len(X)
+        mean_b = X.mean(axis=0)
+        D = X - mean_b
+        delta = mean_b - self.mean
+        total = self.n + m
+        self._m2 = self._m2 + D.T @ D + np.outer(delta, delta) * (self.n * m / total)
+        self.mean = self.mean + delta * (m / total)
+        self.n = total
+
+    # The reverse of _add
+    def _remove(self, X):
+        m = len(X)
+        mean_b = X.mean(axis=0)
+        D = X - mean_b
+        rest = self.n - m
+        mean_rest = (self.n * self.mean - m * mean_b) / rest
+        delta = mean_b - mean_rest
+        self._m2 = self._m2 - D.T @ D - np.outer(delta, delta) * (rest * m / self.n)
+        self.mean = mean_rest
+        self.n = rest
+
+    def _shrink(self):
+        if self.shrinkage == "auto":
+            N = len(self.mean)
+            return N > SHRINK_ASSETS or self.n < SHRINK_ROWS_PER_ASSET * N
+        return self.shrinkage == "ledoit-wolf"
+
+    # Ledoit and Wolf (2004): shrink towards the average variance times the identity
+    def _ledoit_wolf(self, cov):
+        X = self._frame.values - self.mean
+        T, N = X.shape
+        S = self._m2 / T
+        target = np.trace(S) / N
+
+        dispersion = np.sum((S - target * np.eye(N)) ** 2)
+        noise = (np.sum(np.sum(X * X, axis=1) ** 2) - T * np.sum(S * S)) / T ** 2
+        weight = 1.0 if dispersion == 0 else min(max(noise / dispersion, 0.0), 1.0)
+
+        shrunk = (1.0 - weight) * cov
+        shrunk[np.diag_indices(N)] += weight * target * T / max(T - 1, 1)
+        return shrunk
+
+    # Clip negative eigenvalues when the matrix is not numerically positive definite
+    @staticmethod
+    def _psd_cholesky(corr):
+        try:
+            return np.linalg.cholesky(corr)
+        except np.linalg.LinAlgError:
+            values, vectors = np.linalg.eigh(corr)
+            values = np.maximum(values, 1e-10 * max(values.max(), 1.0))
+            repaired = (vectors * values) @ vectors.T
+            d = np.sqrt(np.diag(repaired))
+            return np.linalg.cholesky(repaired / np.outer(d, d))
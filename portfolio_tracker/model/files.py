@@ -0,0 +1,22 @@
+import os
+import threading
+
+
+def atomic_write(path, write):
+    """
+    Write a file by calling write(f) on a temporary file next to it, then
+    move it into place with os.replace, so a reader never sees half a file.
+    The temporary name holds the process and thread id, so two writers of
+    the same file, in other processes or threads, never share it.
+    """
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tmp.open("wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,208 @@
+import threading
+import zipfile
+import numpy as np
+from datetime import date, timedelta
+from functools import wraps
+from pathlib import Path
+from model.files import atomic_write
+from model.lazy import lazy_import
+from model.profiling import count, profiled, span
+from model.returns_matrix import ReturnsMatrix
+
+pd = lazy_import("pandas")
+
+
+# One caller at a time: a background prefetch and the menu wait for each other
+# instead of downloading the same bars twice
+def _locked(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class HistoryStore:
+    """
+    Local store of daily close prices, one .npz file per ticker.
+    Bars that were fetched before are read from disk and only the
+    missing head or tail of the requested range is downloaded.
+    """
+
+    def __init__(self, provider, folder=None):
+        # Point to the history folder inside the data folder
+        root = Path(__file__).resolve().parent.parent
+        self.folder = Path(folder) if folder else root / "data" / "history"
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.provider = provider
+
+        # Loaded files are kept in memory for the rest of the session
+        self._memory = {}
+
+        # Bumped whenever stored bars change, so estimates built on them can be re-used until then
+        self.version = 0
+
+        # Returns matrices per tickers and range, with the version and day they were built at
+        self._returns = {}
+
+        self._lock = threading.RLock()
+
+    # Get the daily close prices for a ticker, reading through the cache
+    def close(self, ticker, period="5y", start=None, end=None):
+        """Return a Series of daily closes for the period or start/end range."""
+        return self.closes([ticker], period, start, end)[ticker.upper()]
+
+    # Same as close, but the missing ranges of all tickers are fetched in one batch
+    @_locked
+    def closes(self, tickers, period="5y", start=None, end=None):
+        """Return a dict of ticker -> Series of daily closes."""
+        start = self._to_date(start) if start else self._period_start(period)
+        end = self._to_date(end) if end else date.today()
+        today = date.today()
+        tomorrow = today + timedelta(days=1)
+
+        entries = {t.upper(): self._load(t.upper()) for t in tickers}
+
+        # Work out which head and/or tail of every ticker is missing
+        requests, needs = {}, {}
+        for ticker, entry in entries.items():
+            head = entry["covered_from"] is None or start < entry["covered_from"]
+            stale = entry["checked"] is None or entry["checked"] < today
+            if head and stale:
+                requests[ticker] = (start, tomorrow)
+            elif head:
+                requests[ticker] = (start, entry["covered_from"])
+            elif stale:
+                requests[ticker] = (self._last_date(entry) or entry["covered_from"], tomorrow)
+            needs[ticker] = (head, stale)
+
+        count("history.fetched", len(requests))
+        count("history.cached", len(entries) - len(requests))
+        fetched = {}
+        if requests:
+            with span("fetch_history", tickers=len(requests)):
+                fetched = self.provider.histories(requests)
+
+        result = {}
+        for ticker, entry in entries.items():
+            if ticker in requests and self._merge(entry, fetched.get(ticker)):
+                head, stale = needs[ticker]
+                if head:
+                    entry["covered_from"] = start
+                if stale:
+                    entry["checked"] = today
+                self._save(ticker, entry)
+
+            dates = entry["dates"]
+            mask = (dates >= np.datetime64(start)) & (dates <= np.datetime64(end))
+            result[ticker] = pd.Series(
+                entry["close"][mask], index=pd.DatetimeIndex(dates[mask]), name="Close"
+            )
+        return result
+
+    # Daily log returns of several tickers on one calendar, memory-mapped from disk
+    @profiled("returns")
+    @_locked
+    def returns(self, tickers, period="5y", start=None, end=None):
+        """
+        Return a ReturnsMatrix of the tickers for the period or start/end
+        range. It is built once per version of the stored bars and kept in
+        data/history/returns, so a new session maps it instead of building
+        it again.
+        """
+        tickers = [t.upper() for t in tickers]
+        closes = self.closes(tickers, period, start, end)
+
+        key = (tuple(tickers), period, start, end)
+        stamp = (self.version, date.today())
+        cached = self._returns.get(key)
+        if cached is None or cached[0] != stamp:
+            count("returns.miss")
+            cached = (stamp, ReturnsMatrix.cached(self.folder / "returns", closes))
+            self._returns[key] = cached
+        else:
+            count("returns.hit")
+        return cached[1]
+
+    # Add freshly downloaded bars to a stored entry, newer bars win
+    def _merge(self, entry, fetched):
+        if fetched is None:
+            return False
+        if fetched.empty:
+            return True
+
+        dates = np.concatenate([entry["dates"], fetched.index.values.astype("datetime64[D]")])
+        close = np.concatenate([entry["close"], fetched.values.astype(float)])
+
+        # Keep the last occurrence of every date, sorted by date
+        order = np.argsort(dates, kind="stable")[::-1]
+        _, first = np.unique(dates[order], return_index=True)
+        keep = order[first]
+        entry["dates"] = dates[keep]
+        entry["close"] = close[keep]
+        return True
+
+    def _load(self, ticker):
+        if ticker in self._memory:
+            return self._memory[ticker]
+        count("history.file_reads")
+
+        entry = {
+            "dates": np.array([], dtype="datetime64[D]"),
+            "close": np.array([], dtype=float),
+            "covered_from": None,
+            "checked": None,
+        }
+        path = self._path(ticker)
+        if path.exists():
+            try:
+                with np.load(path) as f:
+                    stored = {"dates": f["dates"], "close": f["close"],
+                              "covered_from": f["covered_from"].item(), "checked": f["checked"].item()}
+                entry.update(stored)
+            except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+                # A damaged file is fetched again from scratch
+                count("history.unreadable")
+
+        self._memory[ticker] = entry
+        return entry
+
+    def _save(self, ticker, entry):
+        if entry["covered_from"] is None:
+            return
+        self.version += 1
+        # An interrupted write or another store saving the same ticker never leaves half a file
+        atomic_write(self._path(ticker), lambda f: np.savez(
+            f,
+            dates=entry["dates"],
+            close=entry["close"],
+            covered_from=np.datetime64(entry["covered_from"], "D"),
+            checked=np.datetime64(entry["checked"], "D"),
+        ))
+
+    def _path(self, ticker):
+        return self.folder / f"{ticker.replace('/', '_')}.npz"
+
+    @staticmethod
+    def _last_date(entry):
+        if entry["dates"].size == 0:
+            return None
+        return entry["dates"][-1].item()
+
+    @staticmethod
+    def _to_date(value):
+        if isinstance(value, date):
+            return value
+        return pd.Timestamp(value).date()
+
+    @staticmethod
+    def _period_start(period):
+        """Translate a yfinance style period ("5y", "6mo", "1d") into a start date."""
+        today = date.today()
+        if period.endswith("mo"):
+            return (pd.Timestamp(today) - pd.DateOffset(months=int(period[:-2]))).date()
+        if period.endswith("y"):
+            return (pd.Timestamp(today) - pd.DateOffset(years=int(period[:-1]))).date()
+        if period.endswith("d"):
+            return today - timedelta(days=int(period[:-1]))
+        raise ValueError(f"Unsupported period: {period}")
@@ -0,0 +1,138 @@
+import csv
+import sqlite3
+from pathlib import Path
+from model.holdings_table import COLUMNS, HoldingsTable
+
+
+class HoldingsStore:
+    """
+    Portfolio holdings in a SQLite database, one row per position.
+    Every change runs in its own transaction, so a crash or a second
+    process cannot leave a half-written file behind. The holdings are kept
+    in memory as a HoldingsTable and only read again after the database
+    has changed.
+    """
+
+    def __init__(self, path, timeout=10.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=timeout)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS holdings ("
+                " id INTEGER PRIMARY KEY,"
+                " ticker TEXT NOT NULL,"
+                " sector TEXT,"
+                " asset_class TEXT,"
+                " quantity REAL NOT NULL,"
+                " purchase_price REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS holdings_ticker ON holdings (ticker)")
+
+        # Cached table with the database state it was read at
+        self._table = None
+        self._positions = None
+        self._read_at = None
+
+        # Bumped on every change made through this store
+        self.version = 0
+
+    # All positions, from memory unless the database changed since the last read
+    def table(self):
+        """Return the holdings as a HoldingsTable, in insertion order."""
+        state = self._state()
+        if self._table is None or self._read_at != state:
+            records = self._conn.execute(f"SELECT {', '.join(COLUMNS)} FROM holdings ORDER BY id").fetchall()
+            columns = list(zip(*records)) if records else [[] for _ in COLUMNS]
+            self._table = HoldingsTable(*columns)
+            self._read_at = state
+        return self._table
+
+    # The lots aggregated per ticker, re-built when the table changes
+    def positions(self):
+        """Return a HoldingsTable with one row per ticker."""
+        table = self.table()
+        if self._positions is None or self._positions[0] is not table:
+            self._positions = (table, table.positions())
+        return self._positions[1]
+
+    def rows(self):
+        """Return a list of dicts with the holdings columns, in insertion order."""
+        return self.table().rows()
+
+    def add(self, ticker, sector, asset_class, quantity, purchase_price):
+        self.add_many([(ticker, sector, asset_class, quantity, purchase_price)])
+
+    # Insert many positions in one transaction
+    def add_many(self, rows):
+        self._insert(rows)
+
+    # Remove every position of a ticker, returns the number of rows removed
+    def delete(self, ticker):
+        with self._conn:
+            removed = self._conn.execute(
+                "DELETE FROM holdings WHERE ticker = ?", (ticker.upper(),)
+            ).rowcount
+        if removed:
+            self._changed()
+        return removed
+
+    # Change fields of every position of a ticker, returns the number of rows changed
+    def update(self, ticker, **fields):
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown holdings fields: {', '.join(sorted(unknown))}")
+        if not fields:
+            return 0
+
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._conn:
+            changed = self._conn.execute(
+                f"UPDATE holdings SET {assignments} WHERE ticker = ?",
+                (*fields.values(), ticker.upper()),
+            ).rowcount
+        if changed:
+            self._changed()
+        return changed
+
+    def clear(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM holdings")
+        self._changed()
+
+    # Load positions from a CSV file with the holdings columns as header
+    def import_csv(self, path, replace=False):
+        """Add all rows of a CSV file, or replace the holdings with them."""
+        with Path(path).open("r", newline="") as f:
+            rows = [[r[c] for c in COLUMNS] for r in csv.DictReader(f)]
+        self._insert(rows, replace)
+        return len(rows)
+
+    # Write all positions to a CSV file in the original portfolio_data.csv layout
+    def export_csv(self, path):
+        rows = self.rows()
+        with Path(path).open("w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return len(rows)
+
+    def close(self):
+        self._conn.close()
+
+    def _insert(self, rows, replace=False):
+        rows = [(str(t).upper(), s, a, float(q), float(p)) for t, s, a, q, p in rows]
+        with self._conn:
+            if replace:
+                self._conn.execute("DELETE FROM holdings")
+            self._conn.executemany(
+                f"INSERT INTO holdings ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?)", rows
+            )
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+
+    # data_version only moves when another connection commits, version covers our own writes
+    def _state(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0], self.version
@@ -0,0 +1,79 @@
+import numpy as np
+
+COLUMNS = ["ticker", "sector", "asset_class", "quantity", "purchase_price"]
+
+
+class HoldingsTable:
+    """
+    The holdings as columns: one NumPy array per field instead of one dict
+    per position. Sector and asset class are stored as integer codes into
+    a list of labels, in order of first appearance, so totals per group
+    are a single np.bincount.
+    """
+
+    __slots__ = ("ticker", "quantity", "purchase_price", "sector_code", "sectors", "class_code", "classes")
+
+    def __init__(self, ticker, sector, asset_class, quantity, purchase_price):
+        self.ticker = np.array(ticker, dtype=str)
+        self.quantity = np.array(quantity, dtype=float)
+        self.purchase_price = np.array(purchase_price, dtype=float)
+        self.sector_code, self.sectors = self._factorize(sector)
+        self.class_code, self.classes = self._factorize(asset_class)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a table from dicts with the holdings columns."""
+        return cls(*[[r[c] for r in rows] for c in COLUMNS])
+
+    def __len__(self):
+        return len(self.ticker)
+
+    @property
+    def sector(self):
+        return np.array(self.sectors, dtype=object)[self.sector_code]
+
+    @property
+    def asset_class(self):
+        return np.array(self.classes, dtype=object)[self.class_code]
+
+    # Back to one dict per position, for the views and CSV export
+    def rows(self):
+        columns = [self.ticker.tolist(), self.sector.tolist(), self.asset_class.tolist(),
+                   self.quantity.tolist(), self.purchase_price.tolist()]
+        return [dict(zip(COLUMNS, values)) for values in zip(*columns)]
+
+    # One row per ticker: the lots summed, priced at their quantity-weighted cost basis
+    def positions(self):
+        """Return a table with one row per ticker, sector and class of its first lot."""
+        codes, tickers = self._factorize(self.ticker)
+        n = len(tickers)
+        quantity = np.bincount(codes, weights=self.quantity, minlength=n)
+        cost = np.bincount(codes, weights=self.quantity * self.purchase_price, minlength=n)
+        first = np.unique(codes, return_index=True)[1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            basis = cost / quantity
+        return HoldingsTable(tickers, self.sector[first], self.asset_class[first], quantity, basis)
+
+    # Sum values per sector or asset class over the positions in mask
+    def group_totals(self, field, values, mask):
+        """Return {label: total} for the groups of field that occur in mask."""
+        if field == "sector":
+            codes, labels = self.sector_code, self.sectors
+        elif field == "asset_class":
+            codes, labels = self.class_code, self.classes
+        else:
+            raise ValueError(f"Cannot group holdings by {field}")
+
+        totals = np.bincount(codes[mask], weights=values[mask], minlength=len(labels))
+        counts = np.bincount(codes[mask], minlength=len(labels))
+        return {labels[i]: float(totals[i]) for i in np.flatnonzero(counts)}
+
+    # Integer codes and their labels, numbered in order of first appearance
+    @staticmethod
+    def _factorize(values):
+        values = np.array(["" if v is None else str(v) for v in values], dtype=str)
+        labels, first, codes = np.unique(values, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order))
+        return rank[codes.reshape(-1)], labels[order].tolist()
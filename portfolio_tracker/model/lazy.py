@@ -0,0 +1,37 @@
+import importlib
+import sys
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported when one of its attributes is
+    first used. The import goes through the normal import system, which
+    locks per module, so the first use may come from any thread.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        value = getattr(module, attr)
+        # Later uses of the same attribute skip __getattr__
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    """
+    Return a module that is only loaded when one of its attributes is first
+    used, so heavy dependencies do not slow down starting the application.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from model.lazy import lazy_import
+from model.profiling import count
+
+pd = lazy_import("pandas")
+
+
+class MarketDataProvider:
+    """
+    Interface for every source of quotes and price history.
+    Subclasses implement the single-ticker calls; the batch calls run them
+    through a bounded thread pool so one slow or failing ticker does not
+    hold up or break the others.
+    """
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+
+    def quote(self, ticker):
+        """Return the latest price for a ticker."""
+        raise NotImplementedError
+
+    def history(self, ticker, start, end):
+        """Return a Series of daily closes in [start, end) indexed by naive dates."""
+        raise NotImplementedError
+
+    def info(self, ticker):
+        """Return descriptive fields such as sector and currentPrice."""
+        return {}
+
+    # Latest prices for all tickers at once, None for the ones that failed
+    def quotes(self, tickers):
+        return self._map(self.quote, [(t,) for t in tickers], list(tickers))
+
+    # Histories for a dict of ticker -> (start, end), None for the ones that failed
+    def histories(self, requests):
+        return self._map(self.history, [(t, s, e) for t, (s, e) in requests.items()], list(requests))
+
+    def _map(self, fn, calls, keys):
+        if not calls:
+            return {}
+
+        count(f"provider.{fn.__name__}", len(calls))
+
+        def safe(args):
+            try:
+                return fn(*args)
+            except Exception:
+                count("provider.errors")
+                return None
+
+        workers = max(1, min(self.max_workers, len(calls)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(zip(keys, pool.map(safe, calls)))
+
+
+# Tickers per batched quote download
+QUOTE_BATCH = 200
+
+
+class YahooProvider(MarketDataProvider):
+    """
+    Yahoo Finance data through yfinance, with retries and rate limiting.
+    The quotes of many tickers come from one download per QUOTE_BATCH
+    tickers. The per-ticker calls share a token bucket: up to `burst` calls
+    (default max_workers) start at once, and after that one every
+    min_interval seconds on average.
+    """
+
+    def __init__(self, max_workers=8, retries=3, backoff=0.5, min_interval=0.025, burst=None):
+        super().__init__(max_workers)
+        self.retries = retries
+        self.backoff = backoff
+        self.min_interval = min_interval
+        self.burst = burst or max_workers
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+
+    def quote(self, ticker):
+        data = self._call(lambda: self._yf().Ticker(ticker).history(period="1d"))
+        return float(data["Close"].iloc[-1])
+
+    # The last close of every ticker from batched downloads; the ones missing are fetched one by one
+    def quotes(self, tickers):
+        tickers = list(tickers)
+        found = {}
+        for i in range(0, len(tickers), QUOTE_BATCH):
+            batch = tickers[i:i + QUOTE_BATCH]
+            count("provider.download")
+            try:
+                data = self._call(lambda: self._yf().download(
+                    batch, period="5d", interval="1d", group_by="ticker", auto_adjust=False,
+                    progress=False, threads=False))
+                found.update(self._last_closes(data, batch))
+            except Exception:
+                count("provider.errors")
+
+        missing = [t for t in tickers if t not in found]
+        if missing:
+            found.update(super().quotes(missing))
+        return {t: found.get(t) for t in tickers}
+
+    # Last close per ticker of a yf.download frame, with or without a ticker level in the columns
+    @staticmethod
+    def _last_closes(data, tickers):
+        if data is None or data.empty:
+            return {}
+        columns = data.columns
+        if isinstance(columns, pd.MultiIndex):
+            level = next(i for i in range(columns.nlevels) if "Close" in columns.get_level_values(i))
+            close = data.xs("Close", axis=1, level=level)
+        else:
+            close = data[["Close"]].set_axis(tickers[:1], axis=1)
+
+        found = {}
+        for ticker in close.columns:
+            values = close[ticker].dropna()
+            if len(values) and ticker in tickers:
+                found[ticker] = float(values.iloc[-1])
+        return found
+
+    def history(self, ticker, start, end):
+        data = self._call(lambda: self._yf().Ticker(ticker).history(
+            start=start.isoformat(), end=end.isoformat()))
+        if data.empty:
+            return pd.Series(dtype=float)
+
+        index = data.index
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        return pd.Series(data["Close"].values, index=index.normalize())
+
+    def info(self, ticker):
+        return self._call(lambda: self._yf().Ticker(ticker).info)
+
+    # Run a request with rate limiting and exponential backoff on failure
+    def _call(self, request):
+        for attempt in range(self.retries):
+            self._wait_turn()
+            try:
+                return request()
+            except Exception:
+                if attempt == self.retries - 1:
+                    raise
+                count("provider.retries")
+                time.sleep(self.backoff * 2 ** attempt)
+
+    # Token bucket: take a token, or wait until the one reserved for this call has been refilled
+    def _wait_turn(self):
+        if self.min_interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) / self.min_interval)
+            self._refilled = now
+            self._tokens -= 1
+            wait = -self._tokens * self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    @staticmethod
+    def _yf():
+        import yfinance as yf
+        return yf
+
+
+class StubProvider(MarketDataProvider):
+    """
+    Offline provider backed by files, for tests and benchmarks.
+    Every ticker has a <TICKER>.csv file with Date and Close columns;
+    an optional info.csv maps ticker to sector.
+    """
+
+    def __init__(self, folder, max_workers=8):
+        super().__init__(max_workers)
+        self.folder = Path(folder)
+        self._frames = {}
+
+    def quote(self, ticker):
+        closes = self._closes(ticker)
+        if closes.empty:
+            raise KeyError(ticker)
+        return float(closes.iloc[-1])
+
+    def history(self, ticker, start, end):
+        closes = self._closes(ticker)
+        return closes[(closes.index >= pd.Timestamp(start)) & (closes.index < pd.Timestamp(end))]
+
+    def info(self, ticker):
+        info = {"currentPrice": self.quote(ticker)}
+        path = self.folder / "info.csv"
+        if path.exists():
+            table = pd.read_csv(path, index_col="ticker")
+            if ticker in table.index:
+                info.update(table.loc[ticker].to_dict())
+        return info
+
+    def _closes(self, ticker):
+        if ticker not in self._frames:
+            path = self.folder / f"{ticker.upper()}.csv"
+            if path.exists():
+                frame = pd.read_csv(path, parse_dates=["Date"], index_col="Date")
+                self._frames[ticker] = frame["Close"].astype(float).sort_index()
+            else:
+                self._frames[ticker] = pd.Series(dtype=float, index=pd.DatetimeIndex([]))
+        return self._frames[ticker]
+
+
+# Pick the provider from the environment, Yahoo Finance unless told otherwise
+def default_provider():
+    """Return the provider named by PORTFOLIO_PROVIDER ("yahoo" or "stub")."""
+    name = os.environ.get("PORTFOLIO_PROVIDER", "yahoo").lower()
+    if name == "stub":
+        root = Path(__file__).resolve().parent.parent
+        folder = os.environ.get("PORTFOLIO_STUB_DIR", root / "data" / "stub")
+        return StubProvider(folder)
+    if name == "yahoo":
+        return YahooProvider()
+    raise ValueError(f"Unknown market data provider: {name}")
@@ -1,263 +1,741 @@
-import csv
+import threading
+import time
+from datetime import date, timedelta
 import numpy as np
 from pathlib import Path
-import yfinance as yf
-from scipy.stats import t as student_t
-import pandas as pd
+from model.covariance import CovarianceEstimator
+from model.history_store import HistoryStore
+from model.holdings_store import HoldingsStore
+from model.lazy import lazy_import
+from model.market_data import default_provider
+from model.profiling import count, profiled, span
+from model.result_store import SimulationStore
+from model.simulation import (
+    batch_errors,
+    checkpoint_days,
+    merge_checkpoint_runs,
+    merge_horizon_runs,
+    paired_errors,
+    run_chunked,
+    shock_control,
+    simulate_checkpoints,
+    simulate_horizons,
+    simulate_terminal,
+    simulate_terminal_exact,
+)
+from model.volatility import (
+    MIN_WINDOW_FRACTION,
+    STANDARD_WINDOWS,
+    TRADING_DAYS,
+    ewma_volatility,
+    garch_volatility,
+    rolling_std,
+)
+from model.watch import LiveValuation
 
+pd = lazy_import("pandas")
 
 
 class Portfolio:
-    def __init__(self):
-        # Point to the CSV file inside the data folder
+    def __init__(self, provider=None, quote_ttl=60, db_path=None, history_dir=None, results_dir=None):
+        # Point to the holdings database and the CSV file inside the data folder
         root = Path(__file__).resolve().parent.parent
         self.csv_path = root / "data" / "portfolio_data.csv"
+        self.db_path = Path(db_path) if db_path else root / "data" / "portfolio.db"
 
-        # Create the CSV file for saving the portfolio data
-        self.csv_path.parent.mkdir(parents=True, exist_ok=True)
-        if not self.csv_path.exists():
-            with self.csv_path.open("w", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow(["ticker", "sector", "asset_class", "quantity", "purchase_price"])
+        # Holdings live in SQLite; a new database starts from the old CSV file
+        new_store = not self.db_path.exists()
+        self.holdings = HoldingsStore(self.db_path)
+        if new_store and self.csv_path.exists():
+            self.holdings.import_csv(self.csv_path)
+
+        # Market data source and the local history cache built on top of it
+        self.market = provider or default_provider()
+        self.history = HistoryStore(self.market, history_dir)
+
+        # Latest quotes are shared by all analyses for quote_ttl seconds
+        self.quote_ttl = quote_ttl
+        self._snapshot = None
+        self._quote_lock = threading.Lock()
+
+        # Simulation parameters with the holdings and history version they were estimated from
+        self._calibration = None
+
+        # Running covariance estimates for the simulations and the correlation analysis
+        self._covariance = {"calibration": CovarianceEstimator(), "correlation": CovarianceEstimator()}
+
+        # Returns and volatilities for the volatility analysis, per positions and history version
+        self._volatility = None
+
+        # Simulation results kept on disk, keyed by their inputs and parameters
+        self.results = SimulationStore(results_dir)
 
     # Add an asset by filling in the ticker
     def add_asset(self, ticker, sector, asset_class, quantity, purchase_price):
         """Add a new position to the portfolio."""
-        with self.csv_path.open("a", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow([ticker, sector, asset_class, quantity, purchase_price])
+        self.holdings.add(ticker, sector, asset_class, quantity, purchase_price)
+        self.invalidate_quotes()
         print(f"Added {ticker}")
     
     # Delete an asset from the portfolio by giving the ticker
     def delete_asset(self, ticker):
-        rows = self.read_portfolio()
-        ticker = ticker.upper()
-    
-        new_rows = [r for r in rows if r["ticker"].upper() != ticker]
-    
-        if len(new_rows) == len(rows):
+        if not self.holdings.delete(ticker):
             return False
-    
-        with self.csv_path.open("w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["ticker", "sector", "asset_class", "quantity", "purchase_price"])
-            for r in new_rows:
-                writer.writerow([
-                    r["ticker"],
-                    r["sector"],
-                    r["asset_class"],
-                    r["quantity"],
-                    r["purchase_price"]
-                ])
+        self.invalidate_quotes()
         return True
 
     # Read out the portfolio and give information
     def read_portfolio(self):
-        """Return all rows from the portfolio file."""
-        with self.csv_path.open("r", newline="") as f:
-            reader = csv.DictReader(f)
-            return list(reader)
+        """Return all positions of the portfolio."""
+        return self.holdings.rows()
     
     # Clear the full portfolio
     def clear_portfolio(self):
-        """Remove all assets and reset the CSV header."""
-        with self.csv_path.open("w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["ticker", "sector", "asset_class", "quantity", "purchase_price"])
+        """Remove all assets."""
+        self.holdings.clear()
+        self.invalidate_quotes()
+
+    # Load positions from a CSV file in the portfolio_data.csv layout
+    def import_csv(self, path=None, replace=False):
+        """Add the positions of a CSV file, or replace the portfolio with them."""
+        count = self.holdings.import_csv(path or self.csv_path, replace)
+        self.invalidate_quotes()
+        return count
+
+    # Save the positions to a CSV file in the portfolio_data.csv layout
+    def export_csv(self, path=None):
+        return self.holdings.export_csv(path or self.csv_path)
+
+    # Get a time-stamped set of quotes, re-used until it is older than quote_ttl
+    def quote_snapshot(self, refresh=False):
+        """Return {"taken": timestamp, "quotes": {ticker: price}} for the holdings."""
+        return self.quotes_for(self.holdings.table().ticker.tolist(), refresh)
+
+    # The snapshot for these tickers; safe to call from a background thread
+    def quotes_for(self, tickers, refresh=False):
+        """
+        Same as quote_snapshot for a list of tickers. A caller that finds
+        another thread fetching quotes waits for it and uses its snapshot.
+        """
+        tickers = set(tickers)
+        with self._quote_lock:
+            snap = self._snapshot
+            if (
+                refresh
+                or snap is None
+                or time.time() - snap["taken"] > self.quote_ttl
+                or not tickers <= snap["quotes"].keys()
+            ):
+                count("quotes.miss")
+                with span("fetch_quotes", tickers=len(tickers)):
+                    snap = {"taken": time.time(), "quotes": self.market.quotes(tickers)}
+                self._snapshot = snap
+            else:
+                count("quotes.hit")
+            return snap
+
+    # Drop the quote snapshot so the next analysis fetches new prices
+    def invalidate_quotes(self):
+        self._snapshot = None
+
+    # Seconds since the quotes in use were fetched
+    def quote_age(self):
+        if self._snapshot is None:
+            return None
+        return time.time() - self._snapshot["taken"]
+
+    # Prices and values of all lots, or of the positions per ticker, as arrays
+    @profiled("valuation")
+    def valuation(self, refresh=False, aggregate=False):
+        """
+        Return the holdings table with the current price, value, gain/loss
+        and return per row, one array each in the order of the table; NaN
+        where there is no price. aggregate=True values one row per ticker,
+        with the lots summed at their average cost.
+        """
+        table = self.holdings.positions() if aggregate else self.holdings.table()
+        quotes = self.quote_snapshot(refresh)["quotes"]
+        price = np.round(np.array([quotes.get(t) for t in table.ticker.tolist()], dtype=float), 2)
+        price[price == 0] = np.nan
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return {
+                "table": table,
+                "price": price,
+                "value": np.round(table.quantity * price, 2),
+                "gain_loss": np.round((price - table.purchase_price) * table.quantity, 2),
+                "return_pct": np.round((price / table.purchase_price - 1) * 100, 2),
+            }
+
+    # Positions with a known, non-zero current value
+    @staticmethod
+    def _held(valuation):
+        value = valuation["value"]
+        return np.isfinite(value) & (value != 0)
 
     # Get the current prices of the portfolio assets
-    def current_prices(self):
+    def current_prices(self, refresh=False):
         """Get the latest market price for each ticker."""
-        rows = self.read_portfolio()
-        for r in rows:
-            ticker = r["ticker"]
-            try:
-                data = yf.Ticker(ticker).history(period="1d")
-                r["current_price"] = round(data["Close"].iloc[-1], 2)
-            except Exception:
-                r["current_price"] = None
+        v = self.valuation(refresh)
+        rows = v["table"].rows()
+        for r, price in zip(rows, self._nan_to_none(v["price"])):
+            r["current_price"] = price
         return rows
 
     # Get the gain/loss at this moment for each asset
-    def current_values(self):
+    def current_values(self, refresh=False):
         """Calculate the current value, gain/loss, and return for each asset."""
-        rows = self.current_prices()
-        for r in rows:
-            qty = float(r["quantity"])
-            buy_price = float(r["purchase_price"])
-            cur_price = r.get("current_price")
-            if cur_price:
-                r["current_value"] = round(qty * cur_price, 2)
-                r["gain_loss"] = round((cur_price - buy_price) * qty, 2)
-                r["return_pct"] = round((cur_price / buy_price - 1) * 100, 2)
-            else:
-                r["current_value"] = None
-                r["gain_loss"] = None
-                r["return_pct"] = None
-        return rows
+        return self._value_rows(self.valuation(refresh))
     
     # Get summary statistics for the full portfolio, including the weights
-    def summary_stats(self):
+    @profiled("summary_stats")
+    def summary_stats(self, refresh=False):
         """Return total portfolio value and weights per asset, sector, and class."""
-        rows = self.current_values()
-    
-        # Filter out rows without current values
-        rows = [r for r in rows if r.get("current_value")]
-    
-        if not rows:
+        v = self.valuation(refresh, aggregate=True)
+        table, value = v["table"], v["value"]
+
+        # Only positions with a current value count
+        held = self._held(v)
+        if not held.any():
             return None
-    
-        total_value = sum(r["current_value"] for r in rows)
-    
-        # Calculate individual weights
-        for r in rows:
-            r["weight"] = round((r["current_value"] / total_value) * 100, 2)
-    
-        # Group by sector
-        sectors = {}
-        for r in rows:
-            sec = r["sector"]
-            sectors[sec] = sectors.get(sec, 0) + r["current_value"]
-    
-        # Group by asset class
-        classes = {}
-        for r in rows:
-            cls = r["asset_class"]
-            classes[cls] = classes.get(cls, 0) + r["current_value"]
-    
-        # Compute weights for each group
-        sector_weights = {k: round((v / total_value) * 100, 2) for k, v in sectors.items()}
-        class_weights = {k: round((v / total_value) * 100, 2) for k, v in classes.items()}
+
+        with span("weights"):
+            total_value = float(value[held].sum())
+            weights = np.round(value / total_value * 100, 2)
+
+            rows = self._value_rows(v, held)
+            for r, w in zip(rows, weights[held].tolist()):
+                r["weight"] = w
+
+        # Group by sector and asset class
+        with span("groups"):
+            sectors = table.group_totals("sector", value, held)
+            classes = table.group_totals("asset_class", value, held)
+            sector_weights = {k: round((t / total_value) * 100, 2) for k, t in sectors.items()}
+            class_weights = {k: round((t / total_value) * 100, 2) for k, t in classes.items()}
     
         return {
             "total_value": round(total_value, 2),
             "assets": rows,
             "sector_weights": sector_weights,
             "class_weights": class_weights,
+            "price_age": self.quote_age(),
         }
+
+    # The positions valued at the current quotes, to be updated one price change at a time
+    def live_valuation(self, refresh=False):
+        """Return a LiveValuation of the positions, or None without holdings."""
+        table = self.holdings.positions()
+        if not len(table):
+            return None
+        return LiveValuation(table, self.quotes_for(table.ticker.tolist(), refresh)["quotes"])
+
+    # One dict per position with the valuation fields, optionally only those in mask
+    def _value_rows(self, valuation, mask=None):
+        table = valuation["table"]
+        fields = ["price", "value", "gain_loss", "return_pct"]
+        names = ["current_price", "current_value", "gain_loss", "return_pct"]
+        rows = table.rows()
+        columns = [self._nan_to_none(valuation[f]) for f in fields]
+        for r, values in zip(rows, zip(*columns)):
+            r.update(zip(names, values))
+        if mask is not None:
+            rows = [r for r, keep in zip(rows, mask.tolist()) if keep]
+        return rows
+
+    @staticmethod
+    def _nan_to_none(values):
+        return [None if x != x else x for x in values.tolist()]
     
     # Function for a rolling window volatility calculation
-    def rolling_volatility(self, window=30):
-        rows = self.current_values()
-        rows = [r for r in rows if r.get("current_value")]
-        if not rows:
+    def rolling_volatility(self, window=30, years=3):
+        return self.volatility("rolling", window, years)
+
+    # Annualised volatility of every position over the last `years`
+    @profiled("volatility")
+    def volatility(self, method="rolling", window=30, years=3):
+        """
+        Return a dict of ticker -> Series of annualised volatility.
+        method is "rolling" (over `window` days), "ewma" or "garch".
+        Only the history of the last `years` years, plus one year to fill the
+        windows, is fetched and read. The returns are read once per positions
+        and history version and the 5/30/90-day windows are computed
+        together, so switching between windows or methods does not read the
+        history again.
+        """
+        panel = self._volatility_panel(years)
+        if panel is None:
             return None
-    
-        tickers = [r["ticker"] for r in rows]
-        result = {}
-    
-        
-        for ticker in tickers:
-            data = yf.Ticker(ticker).history(period="5y")  
-            if data.empty:
-                continue
-    
-            returns = data["Close"].pct_change().dropna()
-            rolling_vol = returns.rolling(window).std() * (252 ** 0.5)
-            result[ticker] = rolling_vol
-    
-        return result
+
+        R = panel["returns"]
+        results = panel["results"]
+        with span("estimate", method=method):
+            if method == "rolling":
+                if window not in results["rolling"]:
+                    results["rolling"].update(rolling_std(R, [window], MIN_WINDOW_FRACTION))
+                values = results["rolling"][window]
+            elif method == "ewma":
+                if "ewma" not in results:
+                    results["ewma"] = ewma_volatility(R)
+                values = results["ewma"]
+            elif method == "garch":
+                if "garch" not in results:
+                    results["garch"] = garch_volatility(R)[0]
+                values = results["garch"]
+            else:
+                raise ValueError(f"Unknown volatility method: {method}")
+
+        first = panel["first"]
+        dates = panel["dates"][first:]
+        values = values[first:] * np.sqrt(TRADING_DAYS)
+        return {t: pd.Series(values[:, j], index=dates) for j, t in enumerate(panel["tickers"])}
+
+    # Daily returns of all positions on one calendar, with the volatilities computed so far
+    def _volatility_panel(self, years):
+        v = self.valuation(aggregate=True)
+        held = self._held(v)
+        if not held.any():
+            return None
+
+        tickers = v["table"].ticker[held].tolist()
+
+        # Only the years shown, and one extra year of returns to fill the longest windows before them
+        shown_from = date.today() - timedelta(days=int(years * 365.25))
+        matrix = self.history.returns(tickers, start=shown_from - timedelta(days=366))
+        if self._volatility is not None and self._volatility[0] == (matrix, years):
+            count("volatility_panel.hit")
+            return self._volatility[1]
+        count("volatility_panel.miss")
+
+        frame = self._with_data(matrix.frame())
+        if frame.empty:
+            return None
+
+        R = frame.values
+        panel = {
+            "tickers": list(frame.columns),
+            "dates": frame.index,
+            "first": frame.index.searchsorted(pd.Timestamp(shown_from)),
+            "returns": R,
+            "results": {"rolling": rolling_std(R, STANDARD_WINDOWS, MIN_WINDOW_FRACTION)},
+        }
+        self._volatility = ((matrix, years), panel)
+        return panel
     
     
+    @profiled("asset_correlation")
     def asset_correlation(self):
         """
         Returns a correlation matrix of daily returns for the current portfolio assets.
         Uses 3 years of daily data.
         """
-        rows = self.current_values()
-        tickers = [r["ticker"] for r in rows]
+        tickers = self.holdings.positions().ticker.tolist()
     
         if len(tickers) < 2:
             return None  
         
-        prices = pd.DataFrame()
-    
-        # Fetch 3 years of daily close prices
-        for t in tickers:
-            data = yf.Ticker(t).history(period="3y")["Close"]
-            if not data.empty:
-                prices[t] = data
+        # Daily log returns of the last 3 years, on the days every asset traded
+        matrix = self.history.returns(tickers, period="5y")
+        returns = self._with_data(matrix.frame(start=date.today() - timedelta(days=3 * 365)))
+        returns = returns.dropna()
     
-        if prices.empty or prices.shape[1] < 2:
+        if returns.shape[1] < 2 or len(returns) < 2:
             return None
     
-        # Compute daily returns
-        returns = prices.pct_change().dropna()
-    
-        # Correlation matrix
-        corr_matrix = returns.corr()
+        # Correlation matrix, updated with the new days since the last time
+        with span("correlation", assets=returns.shape[1]):
+            corr = self._covariance["correlation"].fit(returns).correlation()
+        corr_matrix = pd.DataFrame(corr, index=returns.columns, columns=returns.columns)
     
         return corr_matrix
 
+    # Drop the tickers without any return in the frame
+    @staticmethod
+    def _with_data(frame):
+        present = frame.notna().any(axis=0)
+        return frame if present.all() else frame.loc[:, present]
 
-    
-    def simulate_portfolio(self, years=15, paths=100_000, dist="normal", corr=True):
+    # Estimate the simulation parameters, cached per holdings and history version
+    @profiled("calibrate")
+    def calibrate(self, corr=True):
+        """
+        Return the positions to simulate with the daily log-return mean and
+        std per asset, the Cholesky factor of their correlation matrix and
+        the Student-t degrees of freedom fitted per asset. Positions with
+        fewer than two daily returns, such as a new listing or a ticker
+        whose history could not be fetched, are left out of the simulation
+        and listed under "skipped"; None when no position is left.
+        The estimates are re-used until the holdings or the stored price
+        history change.
+        """
+        v = self.valuation(aggregate=True)
+        held = self._held(v)
+        if not held.any():
+            return None
+
+        tickers = v["table"].ticker[held].tolist()
+        matrix = self.history.returns(tickers, period="5y")
+        key = (tuple(tickers), corr, self.history.version)
+        if self._calibration is None or self._calibration[0] != key:
+            count("calibration.miss")
+            with span("estimate", assets=len(tickers)):
+                # A position needs at least two daily returns to be estimated; the others are left out
+                column = {t: j for j, t in enumerate(matrix.tickers)}
+                observed = np.isfinite(matrix.values).sum(axis=0)
+                keep = np.array([t in column and observed[column[t]] >= 2 for t in tickers])
+                cols = [column[t] for t, k in zip(tickers, keep) if k]
+
+                # Daily log-return stats per asset, from all the days it has a return
+                every = cols == list(range(len(column)))
+                R = matrix.values if every else matrix.values[:, cols]
+                mu = np.nanmean(R, axis=0)    # daily mean
+                sigma = np.nanstd(R, axis=0)  # daily std
+
+                # Correlation so we can scale by sigma once in the SDE, from the days all assets traded
+                if corr and len(cols) > 1:
+                    if every:
+                        complete = matrix.frame(complete=True)
+                    else:
+                        complete = matrix.frame().iloc[:, cols].dropna()
+                    L = self._covariance["calibration"].fit(complete).cholesky()
+                else:
+                    L = np.eye(len(cols))
+
+                # Student-t degrees of freedom per asset from the excess kurtosis, which is 6 / (df - 4);
+                # an asset whose price never moved has no kurtosis and gets the largest df
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    kurt = np.nanmean((R - mu) ** 4, axis=0) / sigma ** 4 - 3
+                df = np.where(np.isfinite(kurt), np.clip(4 + 6 / np.maximum(kurt, 1e-6), 4.5, 100), 100)
+
+            self._calibration = (key, (mu, sigma, L, df, keep))
+        else:
+            count("calibration.hit")
+
+        mu, sigma, L, df, keep = self._calibration[1]
+        if not keep.any():
+            return None
+        p0 = v["price"][held][keep]
+        v0 = v["value"][held][keep]
+        weights = v0 / float(v0.sum())
+        skipped = [t for t, k in zip(tickers, keep) if not k]
+        tickers = [t for t, k in zip(tickers, keep) if k]
+        return {"tickers": tickers, "p0": p0, "weights": weights, "mu": mu, "sigma": sigma, "L": L, "df": df,
+                "skipped": skipped}
+
+    @profiled("simulate_portfolio")
+    def simulate_portfolio(self, years=15, paths=100_000, dist="normal", corr=True, memory_mb=256,
+                           method="paths", seed=None, workers=1, precision="float64", df=5,
+                           sampling="pseudo", control=False, batches=20, target_var_se=None,
+                           max_paths=1_000_000, store=True):
         """
         Monte Carlo simulation of FINAL portfolio value after 15 years.
         Returns VaR/ES, and the final-values distribution.
         Correlation via Cholesky of the correlation matrix.
+        The shocks are generated in blocks of at most memory_mb megabytes.
+        method="exact" samples the final values directly in one draw; it is
+        exact for normal shocks, Student-t shocks keep the path-wise route.
+        With a seed or workers > 1 the paths are split over independent
+        random streams and processes; the result only depends on the seed.
+        precision="float32" samples the path-wise shocks in single precision.
+        Student-t shocks are multivariate t with `df` degrees of freedom;
+        df="fit" uses the median of the per-asset estimates from calibrate.
+
+        sampling="antithetic" pairs every path with its mirror image, and
+        sampling="sobol" (method="exact" with normal shocks only) uses
+        scrambled Sobol points. A Sobol batch is a power of two points, so
+        paths is rounded up to whole batches: the batch is the largest power
+        of two not above paths / batches, and there are as many batches as
+        needed, for example 20 batches of 4,096 and 102,400 paths for
+        100,000. Standard errors from the batches are returned under "se",
+        or None with fewer than two batches; control=True adds "mean_cv",
+        the mean corrected with the zero-mean shock sum as control variate.
+        With target_var_se, rounds of `paths` paths are added until the
+        standard error of the VaR is below it or max_paths is reached.
+
+        Results are stored under data/simulations, see _stored_run for store.
         """
-        rows = self.current_values()
-        rows = [r for r in rows if r.get("current_value")]
-        if not rows:
+        cal = self.calibrate(corr)
+        if cal is None:
             return None
 
-        tickers = [r["ticker"] for r in rows]
-        p0 = np.array([r["current_price"] for r in rows], dtype=float)
-        v0 = np.array([r["current_value"] for r in rows], dtype=float)
-        port0 = float(v0.sum())
-        weights = v0 / port0
-
-        # Estimate daily log-return stats from history
-        rets = []
-        for t in tickers:
-            h = yf.Ticker(t).history(period="5y")
-            r = np.log(h["Close"] / h["Close"].shift(1)).dropna().values
-            rets.append(r)
-
-        # Align lengths 
-        maxlen = max(len(r) for r in rets)
-        aligned = [np.pad(r, (maxlen - len(r), 0), mode="edge") for r in rets]
-        R = np.vstack(aligned).T  # shape (T, N)
-
-        mu = R.mean(axis=0)         # daily mean
-        sigma = R.std(axis=0)       # daily std
-
-        # Correlation so we can scale by sigma once in the SDE
-        if corr and len(tickers) > 1:
-            C = np.corrcoef(R.T)
-            try:
-                L = np.linalg.cholesky(C)
-            except np.linalg.LinAlgError:
-                eps = 1e-10
-                L = np.linalg.cholesky(C + eps * np.eye(C.shape[0]))
+        if int(years * 252) < 1:
+            raise ValueError("The horizon must be at least one trading day (years >= 1/252)")
+        settings = dict(years=years, paths=paths, dist=dist, corr=corr, method=method, seed=seed,
+                        precision=precision, df=df, sampling=sampling, control=control, batches=batches,
+                        target_var_se=target_var_se, max_paths=max_paths)
+        key, stored, seed = self._stored_run("simulate_portfolio", settings, cal, store)
+        if stored is not None:
+            return stored
+
+        exact = method == "exact" and dist == "normal"
+        if sampling == "sobol" and not exact:
+            raise ValueError("Sobol sampling needs method='exact' with normal shocks")
+
+        # Even batches keep antithetic pairs together; a Sobol batch is one scrambled net
+        if sampling == "sobol":
+            batch = 2 ** int(np.log2(max(2, paths // batches)))
+            paths = -(-paths // batch) * batch
         else:
-            L = np.eye(len(tickers))
+            batch = max(2, paths // batches // 2 * 2)
 
-        # Simulate geometric Brownian motion 
+        # Simulate geometric Brownian motion in memory-bounded blocks
         days = int(years * 252)
-        dt = 1.0 / 252.0
-
-        if dist == "normal":
-            Z = np.random.normal(0.0, 1.0, (paths, days, len(tickers)))
+        params = dict(p0=cal["p0"], mu=cal["mu"], sigma=cal["sigma"], L=cal["L"], days=days,
+                      antithetic=sampling == "antithetic")
+        if exact:
+            engine = simulate_terminal_exact
+            if sampling == "sobol":
+                params["sobol_batch"] = batch
         else:
-            # Student-t standardized to unit variance: t(df)/sqrt(df/(df-2))
-            df = 5
-            Z = student_t.rvs(df=df, size=(paths, days, len(tickers))) / np.sqrt(df / (df - 2))
+            engine = simulate_terminal
+            params.update(dist=dist, df=self._joint_df(df, cal), memory_mb=memory_mb, precision=precision)
+
+        values, controls = [], []
+        while True:
+            # Every round after the first needs its own random streams
+            round_seed = seed if seed is None or not values else [seed, len(values)]
+            with span("sample", paths=paths, days=days, engine=engine.__name__):
+                if sampling == "sobol":
+                    # Sobol points are cheap, so they are generated in this process
+                    rng = None if round_seed is None else np.random.default_rng(round_seed)
+                    finals = engine(paths=paths, rng=rng, **params)
+                elif seed is None and workers == 1:
+                    finals = engine(paths=paths, **params)
+                else:
+                    finals = run_chunked(engine, paths, round_seed, workers, **params)
+            self._count_paths(paths, days if not exact else 1)
+
+            values.append((finals * cal["weights"]).sum(axis=1))
+            if control:
+                controls.append(shock_control(finals, cal["p0"], cal["mu"], cal["sigma"], days, cal["weights"]))
+
+            final_values = np.concatenate(values)
+            with span("statistics"):
+                result = self._terminal_stats(final_values, batch)
+            # Without standard errors (fewer than two batches) more paths are needed to judge
+            se = result["se"]
+            if (target_var_se is None or (se is not None and se["var5"] <= target_var_se)
+                    or len(final_values) + paths > max_paths):
+                break
+
+        if control:
+            X = np.concatenate(controls)
+            beta = np.cov(final_values, X)[0, 1] / X.var(ddof=1)
+            adjusted = final_values - beta * X
+            result["mean_cv"] = float(adjusted.mean())
+            if result["se"] is not None:
+                result["se"]["mean_cv"] = batch_errors(adjusted, batch)["mean"]
+
+        result["seed"] = seed
+        result["skipped"] = cal["skipped"]
+        if store:
+            self._save_run(key, "simulate_portfolio", settings, cal, result)
+        return result
+
+    @profiled("simulate")
+    def simulate(self, years=15, paths=100_000, dist="normal", corr=True, method="paths", seed=None,
+                 workers=1, step="weekly", sketch=False, memory_mb=256, precision="float64", df=5,
+                 sampling="pseudo", batches=20, store=True):
+        """
+        One Monte Carlo run for the results, the histogram and the fan chart.
+        Returns the same statistics as simulate_portfolio, with the fan chart
+        bands of the same paths under "bands". See simulate_fan_chart for
+        step and sketch; sampling may be "pseudo" or "antithetic".
+        """
+        cal = self.calibrate(corr)
+        if cal is None:
+            return None
+
+        if int(years * 252) < 1:
+            raise ValueError("The horizon must be at least one trading day (years >= 1/252)")
+        settings = dict(years=years, paths=paths, dist=dist, corr=corr, method=method, seed=seed, step=step,
+                        sketch=sketch, precision=precision, df=df, sampling=sampling, batches=batches)
+        key, stored, seed = self._stored_run("simulate", settings, cal, store)
+        if stored is not None:
+            return stored
 
-        # Apply correlation to the *standard-normal* shocks
-        Z = Z @ L.T  
+        days = int(years * 252)
+        params = dict(p0=cal["p0"], mu=cal["mu"], sigma=cal["sigma"], L=cal["L"], weights=cal["weights"],
+                      days=days, step=step, dist=dist, df=self._joint_df(df, cal), method=method,
+                      memory_mb=memory_mb, precision=precision, antithetic=sampling == "antithetic")
+        if sketch:
+            # Log-range wide enough for 6 standard deviations of the most volatile asset
+            spread = 6 * cal["sigma"].max() * np.sqrt(days) + np.abs(cal["mu"]).max() * days
+            start_value = float((cal["weights"] * cal["p0"]).sum())
+            params["sketch_bounds"] = (start_value * np.exp(-spread), start_value * np.exp(spread))
+
+        with span("sample", paths=paths, days=days, engine="simulate_checkpoints"):
+            if seed is None and workers == 1:
+                final_values, checkpoints = simulate_checkpoints(paths=paths, **params)
+            else:
+                final_values, checkpoints = run_chunked(simulate_checkpoints, paths, seed, workers,
+                                                        merge=merge_checkpoint_runs, **params)
+        self._count_paths(paths, days)
+
+        # Percentile bands across paths for each checkpoint, in one pass
+        levels = [2.5, 5, 25, 50, 75, 95, 97.5]
+        with span("percentiles", sketch=sketch):
+            if sketch:
+                bands = checkpoints.quantiles(levels)
+            else:
+                bands = np.percentile(checkpoints, levels, axis=0)
+
+        with span("statistics"):
+            result = self._terminal_stats(final_values, max(2, paths // batches // 2 * 2))
+        result["bands"] = dict(zip(["p025", "p5", "p25", "p50", "p75", "p95", "p975"], bands))
+        result["bands"]["days"] = checkpoint_days(days, step)
+
+        result["seed"] = seed
+        result["skipped"] = cal["skipped"]
+        if store:
+            self._save_run(key, "simulate", settings, cal, result)
+        return result
+
+    @profiled("simulate_fan_chart")
+    def simulate_fan_chart(self, years=15, paths=2000, dist="normal", corr=True, seed=None, workers=1,
+                           step="weekly", sketch=False, memory_mb=256, precision="float64", df=5, store=True):
+        """
+        Returns percentile bands of the portfolio value over time.
+        The bands are taken at checkpoints every `step` trading days ("daily",
+        "weekly", "monthly" or a number of days). With sketch=True each
+        checkpoint keeps a streaming quantile sketch instead of all paths,
+        so memory does not grow with the number of paths.
+        """
+        sim = self.simulate(years, paths, dist, corr, seed=seed, workers=workers, step=step,
+                            sketch=sketch, memory_mb=memory_mb, precision=precision, df=df, store=store)
+        if sim is None:
+            return None
+        return sim["bands"]
+
+    @profiled("simulate_sweep")
+    def simulate_sweep(self, years=(1, 5, 10, 15), dists=("normal", "t"), variants=None, paths=100_000,
+                       corr=True, method="exact", seed=None, workers=1, memory_mb=256, df=5,
+                       sampling="antithetic", batches=20, store=True):
+        """
+        Terminal statistics for a grid of horizons, distributions and
+        parameter variants, all from one simulation of the paths.
+
+        variants maps a name to changes of the calibrated parameters: "vol",
+        a factor on the volatilities, "drift", added to the drift rates, and
+        "df", the Student-t degrees of freedom; the default is one "base"
+        variant without changes. Every distribution is combined with every
+        variant. The statistics are recorded at every horizon of `years` on
+        the way to the longest one, and all scenarios share their random
+        numbers, so every row also has its difference to the first scenario
+        at the same horizon ("delta") with the standard error of that
+        difference, which is much smaller than for independent runs.
+        method="exact" steps from horizon to horizon when all shocks are
+        normal. Results are stored like those of simulate.
+        """
+        cal = self.calibrate(corr)
+        if cal is None:
+            return None
 
-        # Simulate final price for each asset, then combine by weights
-        finals = np.zeros((paths, len(tickers)), dtype=float)
-        for i, (p0_i, mu_i, sig_i) in enumerate(zip(p0, mu, sigma)):
-            # Daily growth factors for this asset for all paths
-            g = np.exp((mu_i - 0.5 * sig_i * sig_i) * dt + sig_i * np.sqrt(dt) * Z[:, :, i])
-            finals[:, i] = p0_i * g.prod(axis=1)
+        variants = variants or {"base": {}}
+        horizons = sorted({float(y) for y in years})
+        if int(horizons[0] * 252) < 1:
+            raise ValueError("Every horizon must be at least one trading day (years >= 1/252)")
+        settings = dict(years=horizons, dists=list(dists), variants=variants, paths=paths, corr=corr,
+                        method=method, seed=seed, df=df, sampling=sampling, batches=batches)
+        key, stored, seed = self._stored_run("simulate_sweep", settings, cal, store)
+        if stored is not None:
+            return stored
 
-        final_values = (finals * weights).sum(axis=1)  
+        scenarios = []
+        for dist in dists:
+            for name, changes in variants.items():
+                scenario = dict(changes, name=f"{dist}/{name}", dist=dist, variant=name)
+                scenario["df"] = self._joint_df(changes.get("df", df), cal) if dist == "t" else None
+                scenarios.append(scenario)
 
-        # Risk metrics on final values
+        days = [int(y * 252) for y in horizons]
+        params = dict(p0=cal["p0"], mu=cal["mu"], sigma=cal["sigma"], L=cal["L"], weights=cal["weights"],
+                      days=days, scenarios=scenarios, method=method, memory_mb=memory_mb,
+                      antithetic=sampling == "antithetic")
+        with span("sample", paths=paths, days=days[-1], scenarios=len(scenarios), engine="simulate_horizons"):
+            if seed is None and workers == 1:
+                values = simulate_horizons(paths=paths, **params)
+            else:
+                values = run_chunked(simulate_horizons, paths, seed, workers, merge=merge_horizon_runs, **params)
+        exact = method == "exact" and "t" not in dists
+        self._count_paths(paths, len(days) if exact else days[-1])
+
+        batch = max(2, paths // batches // 2 * 2)
+        rows = []
+        with span("statistics", rows=len(scenarios) * len(days)):
+            for h, (y, d) in enumerate(zip(horizons, days)):
+                base = self._terminal_stats(values[0, h], batch)
+                for k, scenario in enumerate(scenarios):
+                    stats = base if k == 0 else self._terminal_stats(values[k, h], batch)
+                    row = {"scenario": scenario["name"], "dist": scenario["dist"], "variant": scenario["variant"],
+                           "df": scenario["df"], "years": y, "days": d}
+                    row.update((name, v) for name, v in stats.items() if name != "final_values")
+                    if k:
+                        row["delta"] = {name: stats[name] - base[name] for name in ("mean", "var5", "es5")}
+                        row["se_delta"] = paired_errors(values[k, h], values[0, h], batch)
+                    rows.append(row)
+
+        result = {"final_values": values, "years": horizons, "days": days,
+                  "scenarios": [s["name"] for s in scenarios], "rows": rows, "paths": paths, "seed": seed,
+                  "skipped": cal["skipped"]}
+        if store:
+            self._save_run(key, "simulate_sweep", settings, cal, result)
+        return result
+
+    # Look up a run in the result store, and pick the seed it will be computed with otherwise
+    def _stored_run(self, kind, settings, cal, store):
+        """
+        Return (key, stored result or None, seed). store=True returns the
+        stored result of an identical request, "refresh" computes it again
+        and replaces it, False neither reads nor writes. A stored run without
+        a seed gets a random one, so it can be reproduced, while the request
+        without a seed still matches it. The worker count and block size do
+        not change a seeded result and are not in the key.
+        """
+        seed = settings["seed"]
+        if not store:
+            return None, None, seed
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy)
+
+        key = self.results.key(kind, settings, cal)
+        stored = self.results.load(key) if store is True else None
+        return key, stored, seed
+
+    # A run with values that are not finite points at bad inputs and is not kept
+    def _save_run(self, key, kind, settings, cal, result):
+        if not np.isfinite(result["final_values"]).all():
+            count("simulations.not_finite")
+            return result
+        return self.results.save(key, kind, settings, cal, result)
+
+    # The newest stored run of the current positions and history, or None
+    def latest_simulation(self, kind="simulate"):
+        cal = self.calibrate()
+        if cal is None:
+            return None
+        inputs = self.results.inputs_digest(cal)
+        for header in self.results.runs(inputs):
+            if header["kind"] == kind:
+                return self.results.load(header["run"]["key"])
+        return None
+
+    # Simulated paths and path steps, counted here because worker processes have their own counters
+    @staticmethod
+    def _count_paths(paths, steps):
+        count("paths", paths)
+        count("path_steps", paths * steps)
+
+    # A multivariate t has one df, so a fitted df is the median over the assets
+    @staticmethod
+    def _joint_df(df, cal):
+        if df == "fit":
+            return float(np.median(cal["df"]))
+        return df
+
+    # Risk metrics on final values, with standard errors from batches of `batch` paths
+    @staticmethod
+    def _terminal_stats(final_values, batch):
         var5 = float(np.percentile(final_values, 5))
         es5 = float(final_values[final_values <= var5].mean())
 
@@ -272,81 +750,7 @@ class Portfolio:
             "p50": float(np.percentile(final_values, 50)),
             "p75": float(np.percentile(final_values, 75)),
             "p95": float(np.percentile(final_values, 95)),
-            "p975": float(np.percentile(final_values, 97.5))
-        }
-    
-    def simulate_fan_chart(self, years=15, paths=2000, dist="normal", corr=True):
-        """
-        Returns percentile bands of the portfolio value over time.
-        """
-        rows = self.current_values()
-        rows = [r for r in rows if r.get("current_value")]
-        if not rows:
-            return None
-    
-        tickers = [r["ticker"] for r in rows]
-        p0 = np.array([r["current_price"] for r in rows], dtype=float)
-        v0 = np.array([r["current_value"] for r in rows], dtype=float)
-        port0 = float(v0.sum())
-        weights = v0 / port0
-    
-        # Estimate statistics
-        rets = []
-        for t in tickers:
-            h = yf.Ticker(t).history(period="5y")
-            r = np.log(h["Close"] / h["Close"].shift(1)).dropna().values
-            rets.append(r)
-    
-        maxlen = max(len(r) for r in rets)
-        aligned = [np.pad(r, (maxlen - len(r), 0), mode="edge") for r in rets]
-        R = np.vstack(aligned).T
-    
-        mu = R.mean(axis=0)
-        sigma = R.std(axis=0)
-    
-        if corr and len(tickers) > 1:
-            C = np.corrcoef(R.T)
-            try:
-                L = np.linalg.cholesky(C)
-            except np.linalg.LinAlgError:
-                L = np.linalg.cholesky(C + 1e-10 * np.eye(C.shape[0]))
-        else:
-            L = np.eye(len(tickers))
-    
-        days = int(years * 252)
-        dt = 1.0 / 252.0
-    
-        if dist == "normal":
-            Z = np.random.normal(0.0, 1.0, (paths, days, len(tickers)))
-        else:
-            df = 5
-            Z = student_t.rvs(df=df, size=(paths, days, len(tickers))) / np.sqrt(df / (df - 2))
-    
-        Z = Z @ L.T  # correlate
-    
-        # Build portfolio paths directly to save memory
-        port_paths = np.zeros((paths, days), dtype=np.float32)
-    
-        for i, (p0_i, mu_i, sig_i, w_i) in enumerate(zip(p0, mu, sigma, weights)):
-            g = np.exp((mu_i - 0.5 * sig_i * sig_i) * dt + sig_i * np.sqrt(dt) * Z[:, :, i])  # (paths, days)
-            price_paths_i = p0_i * np.cumprod(g, axis=1)
-            port_paths += (w_i * price_paths_i).astype(np.float32)
-    
-        # Percentile bands across paths, for each day
-        p025 = np.percentile(port_paths, 2.5, axis=0)
-        p5   = np.percentile(port_paths, 5, axis=0)
-        p25  = np.percentile(port_paths, 25, axis=0)
-        p50  = np.percentile(port_paths, 50, axis=0)
-        p75  = np.percentile(port_paths, 75, axis=0)
-        p95  = np.percentile(port_paths, 95, axis=0)
-        p975 = np.percentile(port_paths, 97.5, axis=0)
-        
-        return {
-            "p025": p025,
-            "p5": p5,
-            "p25": p25,
-            "p50": p50,
-            "p75": p75,
-            "p95": p95,
-            "p975": p975
+            "p975": float(np.percentile(final_values, 97.5)),
+            "paths": len(final_values),
+            "se": batch_errors(final_values, batch),
         }
@@ -0,0 +1,84 @@
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from model.profiling import count, span
+
+# Imported in the background at start-up, as the first analysis and chart need them. Not
+# pyplot itself: view/plotting.py chooses the backend before pyplot is imported.
+MODULES = ("pandas", "matplotlib.figure")
+
+
+class Prefetcher:
+    """
+    Loads the quotes and price history of the holdings, and imports the
+    analysis libraries, in background threads while the user is in the
+    menu, so the first analysis finds them in memory. Every load is keyed: asking again for one that is
+    still running returns the same future instead of starting another
+    download. A menu action that needs data being loaded waits for it
+    on the lock of the quote snapshot or the history store.
+    """
+
+    def __init__(self, portfolio, max_workers=2):
+        self.portfolio = portfolio
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    # Quotes, five years of history and the returns matrix of the current positions
+    def warm_up(self):
+        # The holdings are read here: the SQLite connection belongs to this thread
+        tickers = self.portfolio.holdings.positions().ticker.tolist()
+        if not tickers:
+            return []
+        return [
+            self.submit(("quotes", tuple(sorted(tickers))), self.portfolio.quotes_for, tickers),
+            self.submit(("returns", tuple(tickers)), self.portfolio.history.returns, tickers, "5y"),
+        ]
+
+    # Import the heavy libraries before the first analysis or chart asks for them
+    def import_modules(self, names=MODULES):
+        return self.submit(("modules",), self._import, names)
+
+    # After add_asset: the new ticker's history, then everything the analyses will ask for
+    def ticker_added(self, ticker):
+        history = self.submit(("history", ticker.upper()), self.portfolio.history.closes, [ticker], "5y")
+        return [history] + self.warm_up()
+
+    def submit(self, key, fn, *args):
+        """Run fn(*args) in the background, unless the load for key is still running."""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None and not future.done():
+                count("prefetch.joined")
+                return future
+            future = self._pool.submit(self._run, key, fn, *args)
+            self._pending[key] = future
+            return future
+
+    # Wait until everything submitted so far is loaded, or the timeout passes
+    def wait(self, timeout=None):
+        with self._lock:
+            futures = list(self._pending.values())
+        return not wait(futures, timeout).not_done
+
+    @staticmethod
+    def _import(names):
+        for name in names:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # A failed prefetch only means the menu action fetches the data itself
+    @staticmethod
+    def _run(key, fn, *args):
+        with span(f"prefetch.{key[0]}"):
+            try:
+                count(f"prefetch.{key[0]}")
+                return fn(*args)
+            except Exception:
+                count("prefetch.errors")
+                return None
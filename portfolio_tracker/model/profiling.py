@@ -0,0 +1,167 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Trace events kept per session; the stage totals and counters keep counting after that
+MAX_EVENTS = 100_000
+
+
+class Profiler:
+    """
+    Wall time per named stage, and counters, for one session. A stage
+    opened inside another is recorded under the path "outer/inner", so
+    the report shows where the time of an analysis went: fetching quotes
+    or history, estimating parameters, sampling or taking percentiles.
+    Counters add up network calls, cache hits and misses, bytes allocated
+    and simulated paths. While disabled nothing is recorded.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.trace_path = None
+        self._registered = False
+        self.reset()
+
+    def reset(self):
+        # Stage path -> calls, seconds, paths simulated and the first start
+        self.stages = {}
+        self.counters = {}
+        self.events = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    # Start recording; the report is printed, and the trace written, when the program exits
+    def enable(self, trace_path=None):
+        self.enabled = True
+        self.trace_path = trace_path or self.trace_path
+        if not self._registered:
+            atexit.register(self.finish)
+            self._registered = True
+
+    @contextmanager
+    def span(self, name, **args):
+        """Time the block as stage `name`; a `paths` argument counts towards the throughput."""
+        if not self.enabled:
+            yield
+            return
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        path = "/".join(stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            self._record(path, name, start, seconds, args)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _record(self, path, name, start, seconds, args):
+        with self._lock:
+            stage = self.stages.get(path)
+            if stage is None:
+                stage = self.stages[path] = {"calls": 0, "seconds": 0.0, "paths": 0, "first": start}
+            stage["calls"] += 1
+            stage["seconds"] += seconds
+            stage["paths"] += args.get("paths", 0)
+
+            if len(self.events) < MAX_EVENTS:
+                self.events.append({
+                    "name": name, "cat": path, "ph": "X", "pid": os.getpid(),
+                    "tid": threading.get_ident(), "ts": (start - self._origin) * 1e6,
+                    "dur": seconds * 1e6, "args": args,
+                })
+            else:
+                self.counters["profiler.dropped_events"] = self.counters.get("profiler.dropped_events", 0) + 1
+
+    # Stage paths in tree order: every stage after its parent, siblings in the order they first ran
+    def _ordered(self):
+        def key(path):
+            parts = path.split("/")
+            return tuple(self.stages.get("/".join(parts[:i + 1]), {"first": 0})["first"]
+                         for i in range(len(parts)))
+        return sorted(self.stages, key=key)
+
+    def report(self):
+        """Return the per-stage breakdown and the counters as text."""
+        if not self.stages and not self.counters:
+            return "Profile: nothing was recorded."
+
+        lines = [f"{'Stage':<44}{'calls':>7}{'total s':>11}{'mean ms':>11}{'of parent':>11}"]
+        for path in self._ordered():
+            stage = self.stages[path]
+            depth = path.count("/")
+            parent = self.stages.get(path.rsplit("/", 1)[0]) if depth else None
+            share = f"{stage['seconds'] / parent['seconds'] * 100:.1f}%" if parent and parent["seconds"] else ""
+            label = "  " * depth + path.rsplit("/", 1)[-1]
+            lines.append(f"{label:<44}{stage['calls']:>7}{stage['seconds']:>11.4f}"
+                         f"{stage['seconds'] / stage['calls'] * 1000:>11.2f}{share:>11}")
+
+        throughput = [(p, s) for p, s in self.stages.items() if s["paths"] and s["seconds"]]
+        if throughput:
+            lines.append("")
+            for path, stage in throughput:
+                lines.append(f"{path:<44}{stage['paths'] / stage['seconds']:>18,.0f} paths/s")
+
+        if self.counters:
+            lines.append("")
+            lines.append(f"{'Counter':<44}{'value':>18}")
+            for name in sorted(self.counters):
+                lines.append(f"{name:<44}{self.counters[name]:>18,}")
+        return "\n".join(lines)
+
+    def write_trace(self, path):
+        """
+        Write the spans in the Chrome trace event format, which chrome://tracing
+        and Perfetto open, with the stage totals and counters alongside.
+        """
+        stages = {p: {k: v for k, v in s.items() if k != "first"} for p, s in self.stages.items()}
+        document = {"traceEvents": self.events, "displayTimeUnit": "ms",
+                    "stages": stages, "counters": self.counters}
+        with open(path, "w") as f:
+            json.dump(document, f, default=str)
+
+    # Print the report to stderr and write the trace file, if one was asked for
+    def finish(self):
+        if not self.enabled:
+            return
+        print("\n" + self.report(), file=sys.stderr)
+        if self.trace_path:
+            self.write_trace(self.trace_path)
+            print(f"Profile trace written to {self.trace_path}", file=sys.stderr)
+
+
+# One profiler for the whole session, switched on by PORTFOLIO_PROFILE=1 or a PORTFOLIO_TRACE file
+PROFILER = Profiler()
+if os.environ.get("PORTFOLIO_PROFILE", "0") not in ("", "0") or os.environ.get("PORTFOLIO_TRACE"):
+    PROFILER.enable(os.environ.get("PORTFOLIO_TRACE"))
+
+span = PROFILER.span
+count = PROFILER.count
+
+
+def profiled(name):
+    """Decorator that records every call of the function as stage `name`."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return fn(*args, **kwargs)
+            with PROFILER.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import time
+import zipfile
+from pathlib import Path
+import numpy as np
+from model.files import atomic_write
+from model.profiling import count
+
+# Number of runs kept on disk, older ones are removed
+MAX_RUNS = 32
+
+# Calibration arrays that, with the parameters and seed, fix the outcome of a simulation
+INPUTS = ("p0", "weights", "mu", "sigma", "L", "df")
+
+# What reading a damaged or half-removed run raises
+UNREADABLE = (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile)
+
+
+class SimulationStore:
+    """
+    Simulation results on disk, two files per run: <key>.npy with the
+    final value of every path, memory-mapped when it is read back, and
+    <key>.npz with the fan chart bands and a JSON header holding the
+    parameters, the seed and the statistics. The key is a hash of the
+    positions, their calibration and the parameters, so an identical
+    request finds the earlier result instead of simulating again.
+    """
+
+    def __init__(self, folder=None, max_runs=MAX_RUNS):
+        root = Path(__file__).resolve().parent.parent
+        self.folder = Path(folder) if folder else root / "data" / "simulations"
+        self.max_runs = max_runs
+
+    # Hash of what the simulation is run on, shared by all runs of one portfolio and history
+    @staticmethod
+    def inputs_digest(cal):
+        h = hashlib.sha1()
+        h.update("\0".join(cal["tickers"]).encode())
+        for name in INPUTS:
+            h.update(np.ascontiguousarray(cal[name], dtype=float).tobytes())
+        return h.hexdigest()
+
+    @classmethod
+    def key(cls, kind, params, cal):
+        """Key of a run: the function, its parameters and the inputs digest."""
+        text = json.dumps([kind, params, cls.inputs_digest(cal)], sort_keys=True, default=str)
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def load(self, key):
+        """Return the stored result for key, with the final values memory-mapped, or None."""
+        values_path, data_path = self._paths(key)
+        if not (values_path.exists() and data_path.exists()):
+            count("simulations.miss")
+            return None
+
+        try:
+            with np.load(data_path) as data:
+                header = json.loads(data["header"].item())
+                bands = {k[len("band_"):]: data[k] for k in data.files if k.startswith("band_")}
+            final_values = np.load(values_path, mmap_mode="r")
+        except UNREADABLE:
+            # Damaged, or pruned by another session meanwhile: simulated again and replaced
+            count("simulations.unreadable")
+            return None
+
+        result = dict(header["stats"])
+        result["final_values"] = final_values
+        if bands:
+            result["bands"] = bands
+        result["run"] = self._run_info(key, header)
+        count("simulations.hit")
+        return result
+
+    def save(self, key, kind, params, cal, result):
+        """Write a result; the arrays of the result are stored, the rest goes into the header."""
+        self.folder.mkdir(parents=True, exist_ok=True)
+        values_path, data_path = self._paths(key)
+
+        header = {
+            "kind": kind,
+            "params": params,
+            "seed": result.get("seed"),
+            "tickers": cal["tickers"],
+            "inputs": self.inputs_digest(cal),
+            "created": time.time(),
+            "stats": {k: v for k, v in result.items() if k not in ("final_values", "bands", "run")},
+        }
+        bands = {f"band_{k}": np.asarray(v) for k, v in (result.get("bands") or {}).items()}
+
+        # The values first and the header last, so a run without its .npz is never read
+        atomic_write(values_path, lambda f: np.save(f, np.asarray(result["final_values"], dtype=float)))
+        atomic_write(data_path, lambda f: np.savez(f, header=np.array(json.dumps(header, default=float)), **bands))
+        result["run"] = self._run_info(key, header)
+        self._prune()
+        return result
+
+    def runs(self, inputs=None):
+        """
+        Headers of the stored runs, newest first, optionally only those of
+        one inputs digest. The final values are not read.
+        """
+        if not self.folder.exists():
+            return []
+        runs = []
+        for data_path in self.folder.glob("*.npz"):
+            try:
+                with np.load(data_path) as data:
+                    header = json.loads(data["header"].item())
+            except UNREADABLE:
+                continue
+            if inputs is None or header["inputs"] == inputs:
+                header["run"] = self._run_info(data_path.stem, header)
+                runs.append(header)
+        return sorted(runs, key=lambda h: h["created"], reverse=True)
+
+    def _paths(self, key):
+        return self.folder / f"{key}.npy", self.folder / f"{key}.npz"
+
+    @staticmethod
+    def _run_info(key, header):
+        return {"key": key, "id": key[:12], "kind": header["kind"], "seed": header["seed"],
+                "created": header["created"]}
+
+    def _prune(self):
+        files = sorted(self.folder.glob("*.npz"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for data_path in files[self.max_runs:]:
+            for path in (data_path, data_path.with_suffix(".npy")):
+                try:
+                    path.unlink()
+                except OSError:
+                    # Still mapped by a running session
+                    pass
@@ -0,0 +1,102 @@
+import hashlib
+import numpy as np
+from model.files import atomic_write
+from model.lazy import lazy_import
+from model.profiling import count, span
+
+pd = lazy_import("pandas")
+
+# Number of matrices kept on disk, older ones are removed
+MAX_FILES = 16
+
+
+class ReturnsMatrix:
+    """
+    Daily log returns of several tickers on one calendar: the union of
+    their trading days. A ticker's return on a day is measured from its
+    previous close, so a day it did not trade is NaN and the next return
+    covers the gap. Days before a ticker's first close are NaN too.
+    The values are usually a read-only memory map; slices by date are views.
+    """
+
+    def __init__(self, tickers, dates, values):
+        self.tickers = list(tickers)
+        self.dates = dates
+        self.values = values
+
+    # Build the matrix from a dict of ticker -> Series of closes
+    @classmethod
+    def from_closes(cls, closes):
+        index = {t: s.index.values.astype("datetime64[D]") for t, s in closes.items()}
+        dates = np.unique(np.concatenate(list(index.values()) or [np.array([], "datetime64[D]")]))
+
+        values = np.full((len(dates), len(closes)), np.nan)
+        for j, (t, s) in enumerate(closes.items()):
+            if len(s) > 1:
+                rows = np.searchsorted(dates, index[t][1:])
+                values[rows, j] = np.diff(np.log(s.values.astype(float)))
+
+        # The first day of the calendar has no return for any ticker
+        keep = ~np.isnan(values).all(axis=1)
+        return cls(closes.keys(), dates[keep], values[keep])
+
+    # Read the matrix for these closes from disk, building and saving it the first time
+    @classmethod
+    def cached(cls, folder, closes):
+        """Return the matrix memory-mapped from folder, keyed by a hash of the closes."""
+        folder.mkdir(parents=True, exist_ok=True)
+        digest = cls._digest(closes)
+        values_path = folder / f"{digest}.npy"
+        dates_path = folder / f"{digest}.dates.npy"
+
+        if values_path.exists() and dates_path.exists():
+            try:
+                dates = np.load(dates_path).astype("datetime64[D]")
+                values = np.load(values_path, mmap_mode="r")
+                if values.shape == (len(dates), len(closes)):
+                    count("returns.mapped")
+                    return cls(closes.keys(), dates, values)
+            except (OSError, ValueError, EOFError):
+                pass
+            # Damaged, or removed by another session in the meantime: built again below
+            count("returns.unreadable")
+
+        with span("build_matrix", tickers=len(closes)):
+            matrix = cls.from_closes(closes)
+            atomic_write(dates_path, lambda f: np.save(f, matrix.dates.astype("int64")))
+            atomic_write(values_path, lambda f: np.save(f, matrix.values))
+            cls._prune(folder)
+        count("returns.built")
+        count("bytes", matrix.values.nbytes)
+        return matrix
+
+    # The rows from start on, optionally only the days on which every ticker has a return
+    def frame(self, start=None, complete=False):
+        """Return a DataFrame of log returns indexed by date, one column per ticker."""
+        first = self.dates.searchsorted(np.datetime64(start, "D")) if start is not None else 0
+        dates, values = self.dates[first:], self.values[first:]
+        if complete:
+            keep = np.isfinite(values).all(axis=1)
+            dates, values = dates[keep], values[keep]
+        return pd.DataFrame(values, index=pd.DatetimeIndex(dates), columns=self.tickers, copy=False)
+
+    @staticmethod
+    def _digest(closes):
+        h = hashlib.sha1()
+        for t, s in closes.items():
+            h.update(t.encode())
+            h.update(s.index.values.astype("datetime64[D]").tobytes())
+            h.update(s.values.astype(float).tobytes())
+        return h.hexdigest()
+
+    @staticmethod
+    def _prune(folder):
+        files = sorted(folder.glob("*.dates.npy"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for dates_path in files[MAX_FILES:]:
+            values_path = dates_path.with_name(dates_path.name.replace(".dates.npy", ".npy"))
+            for path in (dates_path, values_path):
+                try:
+                    path.unlink()
+                except OSError:
+                    # Still mapped by a running session
+                    pass
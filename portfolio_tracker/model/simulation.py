@@ -0,0 +1,510 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from model import profiling
+
+# Working arrays per simulated (path, day, asset) shock: the draw itself
+# and the correlated log-prices at the checkpoints of a fan chart, with
+# room for temporaries
+ARRAYS_PER_SHOCK = 3
+
+# Paths per independent random stream when a seed or workers are given.
+# The split does not depend on the worker count, so neither does the result.
+CHUNK_PATHS = 10_000
+
+# Checkpoint spacing in trading days for the named fan chart resolutions
+CHECKPOINT_STEPS = {"daily": 1, "weekly": 5, "monthly": 21}
+
+
+def draw_shocks(shape, dist="normal", df=5, rng=None, out=None, chi_rng=None):
+    """
+    Unit-variance shocks of shape (paths, days, N).
+
+    Normal shocks come from rng, or from the global NumPy random state when
+    rng is None. Student-t shocks are multivariate t: every asset on a
+    (path, day) is divided by the same sqrt(chi2(df) / df), so once the
+    normals are correlated the shocks follow a proper multivariate t. They
+    need an rng, and take the chi-square draws from chi_rng so both streams
+    stay sequential however the run is split into blocks. With `out` the
+    shocks are written into that array, in its dtype.
+    """
+    if rng is None:
+        if dist != "normal":
+            raise ValueError("Student-t shocks need a Generator, see block_rng")
+        profiling.count("bytes", int(np.prod(shape)) * 8)
+        return np.random.normal(0.0, 1.0, shape)
+
+    if out is None:
+        out = np.empty(shape)
+        profiling.count("bytes", out.nbytes)
+    rng.standard_normal(dtype=out.dtype, out=out)
+
+    if dist != "normal":
+        # chi2(df) = 2 * gamma(df / 2), one draw per path and day shared by all assets
+        chi = (chi_rng or rng).standard_gamma(df / 2, size=out.shape[:-1] + (1,), dtype=out.dtype)
+        # Scale t(df) to unit variance: t(df) / sqrt(df / (df - 2)) = normal / sqrt(chi2 / (df - 2))
+        np.multiply(chi, 2.0 / (df - 2), out=chi)
+        np.sqrt(chi, out=chi)
+        np.divide(out, chi, out=out)
+    return out
+
+
+class BlockBuffer:
+    """
+    Flat scratch array re-used by every block of a simulation, so blocks
+    of different shapes do not allocate new memory.
+    """
+
+    def __init__(self, size, dtype):
+        self.data = np.empty(size, dtype=dtype)
+        profiling.count("bytes", self.data.nbytes)
+
+    def view(self, shape):
+        """Contiguous view of the first prod(shape) elements."""
+        return self.data[:int(np.prod(shape))].reshape(shape)
+
+
+def block_rng(rng, precision, dist="normal"):
+    """
+    Return (rng, chi_rng) for a run. Reduced precision and Student-t shocks
+    need a Generator, so without one it is seeded from the global NumPy
+    random state. chi_rng is a separate stream for the chi-square draws of
+    Student-t shocks.
+    """
+    if rng is None and (np.dtype(precision) != np.float64 or dist != "normal"):
+        rng = np.random.default_rng(np.random.randint(0, 2 ** 32))
+    if rng is None:
+        return None, None
+    return rng, rng.spawn(1)[0]
+
+
+def block_sizes(paths, days, n_assets, memory_mb, precision="float64", antithetic=False):
+    """
+    Return (path_block, day_block) so one block of shocks fits in memory_mb.
+    Antithetic blocks hold an even number of paths so pairs are not split.
+    A horizon of 0 days draws nothing, so all paths fit in one block.
+    """
+    itemsize = np.dtype(precision).itemsize
+    budget = max(1, int(memory_mb * 1024 ** 2) // (ARRAYS_PER_SHOCK * itemsize))
+    per_path = max(1, days * n_assets)
+    if per_path <= budget:
+        path_block = max(1, min(paths, budget // per_path))
+        if antithetic and path_block < paths:
+            path_block = max(2, path_block - path_block % 2)
+        return path_block, max(1, days)
+
+    # A single path does not fit, so walk through its days in blocks
+    return (2 if antithetic else 1), max(1, budget // n_assets)
+
+
+def drawn_paths(paths, antithetic):
+    """Number of paths whose shocks are drawn; antithetic partners re-use them."""
+    return (paths + 1) // 2 if antithetic else paths
+
+
+def antithetic_rows(paths, antithetic):
+    """
+    Return (rows, sign, count) for the paths of a block: which rows are
+    driven by the first `count` drawn shocks, with which sign. Antithetic
+    pairs sit next to each other, so contiguous slices of an even length
+    always hold whole pairs.
+    """
+    if not antithetic:
+        return [(slice(None), 1.0, paths)]
+    return [(slice(0, None, 2), 1.0, (paths + 1) // 2), (slice(1, None, 2), -1.0, paths // 2)]
+
+
+def sobol_normals(paths, n_assets, batch, rng):
+    """
+    Standard normals from scrambled Sobol points. Every batch of paths (a
+    power of two) gets its own scramble, so batches are independent
+    randomised QMC replicates.
+    """
+    from scipy.special import ndtri
+    from scipy.stats import qmc
+
+    m = int(np.log2(batch))
+    Z = np.empty((paths, n_assets))
+    for start in range(0, paths, batch):
+        points = qmc.Sobol(d=n_assets, scramble=True, seed=rng).random_base2(m)
+        Z[start:start + batch] = ndtri(points[:min(batch, paths - start)])
+    return Z
+
+
+def simulate_terminal(p0, mu, sigma, L, days, paths, dist="normal", df=5, memory_mb=256, rng=None,
+                      precision="float64", antithetic=False):
+    """
+    Final price of every asset on every path under correlated GBM.
+
+    Paths and days are processed in blocks and only the running log-price
+    per path and asset is kept. The blocks draw their shocks in the same
+    order as a single (paths, days, N) draw would, so for a fixed seed the
+    result equals the full-tensor simulation up to rounding.
+    precision="float32" draws the shocks in single precision into one
+    buffer re-used by all blocks; the log-prices stay in float64.
+    antithetic=True pairs every path with one driven by the negated shocks.
+    """
+    n = len(p0)
+    dt = 1.0 / 252.0
+    drift = (mu - 0.5 * sigma * sigma) * dt
+    scale = sigma * np.sqrt(dt)
+    path_block, day_block = block_sizes(paths, days, n, memory_mb, precision, antithetic)
+    rng, chi_rng = block_rng(rng, precision, dist)
+    buffer = BlockBuffer(path_block * day_block * n, precision) if rng is not None else None
+
+    finals = np.empty((paths, n))
+    profiling.count("bytes", finals.nbytes)
+    for start in range(0, paths, path_block):
+        stop = min(start + path_block, paths)
+        log_price = np.zeros((stop - start, n))
+
+        for d0 in range(0, days, day_block):
+            d1 = min(d0 + day_block, days)
+            shape = (drawn_paths(stop - start, antithetic), d1 - d0, n)
+            Z = draw_shocks(shape, dist, df, rng, buffer.view(shape) if buffer else None, chi_rng)
+
+            # Correlation is linear, so correlate the summed shocks instead of every day
+            moves = scale * (Z.sum(axis=1, dtype=np.float64) @ L.T)
+            for rows, sign, count in antithetic_rows(stop - start, antithetic):
+                log_price[rows] += (d1 - d0) * drift + sign * moves[:count]
+
+        finals[start:stop] = p0 * np.exp(log_price)
+    return finals
+
+
+def simulate_terminal_exact(p0, mu, sigma, L, days, paths, rng=None, antithetic=False, sobol_batch=None):
+    """
+    Final price of every asset on every path, sampled in one draw.
+
+    Under GBM with normal shocks the sum of the daily correlated shocks
+    over the horizon is again correlated normal with variance `days`, so
+    the final log-price only needs one (paths, N) draw. The draw can be
+    antithetic, or come from scrambled Sobol points with a fresh scramble
+    for every sobol_batch paths.
+    """
+    dt = 1.0 / 252.0
+    drift = (mu - 0.5 * sigma * sigma) * dt * days
+    if sobol_batch:
+        Z = sobol_normals(paths, len(p0), sobol_batch, block_rng(rng, "float32")[0])
+    else:
+        Z = np.empty((paths, len(p0)))
+        profiling.count("bytes", Z.nbytes)
+        half = draw_shocks((drawn_paths(paths, antithetic), len(p0)), rng=rng)
+        for rows, sign, count in antithetic_rows(paths, antithetic):
+            Z[rows] = sign * half[:count]
+    Z = Z @ L.T
+    return p0 * np.exp(drift + sigma * np.sqrt(dt * days) * Z)
+
+
+def checkpoint_days(days, step):
+    """Day numbers (1-based) at which portfolio values are recorded, always including the last day."""
+    step = CHECKPOINT_STEPS.get(step, step)
+    points = np.arange(step, days + 1, step)
+    if points.size == 0 or points[-1] != days:
+        points = np.append(points, days)
+    return points
+
+
+class QuantileSketch:
+    """
+    Streaming quantile estimate for a set of checkpoints.
+
+    Values are counted in a fixed log-spaced histogram per checkpoint, so
+    memory is checkpoints x bins no matter how many paths are added, and
+    sketches of separate chunks merge by adding their counts. Quantiles
+    are interpolated within a bin; values outside [lo, hi] fall in the
+    outermost bins.
+    """
+
+    def __init__(self, n_points, lo, hi, bins=8192):
+        self.edges = np.linspace(np.log(lo), np.log(hi), bins + 1)
+        self.counts = np.zeros((n_points, bins), dtype=np.int64)
+
+    def update(self, values):
+        """Add a (paths, checkpoints) block of values."""
+        n_points, bins = self.counts.shape
+        # The bins are evenly spaced in log-value, so the bin index is arithmetic
+        width = self.edges[1] - self.edges[0]
+        idx = ((np.log(values) - self.edges[0]) / width).astype(np.int64)
+        np.clip(idx, 0, bins - 1, out=idx)
+        idx += np.arange(n_points) * bins
+        self.counts += np.bincount(idx.ravel(), minlength=n_points * bins).reshape(n_points, bins)
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def quantiles(self, percentiles):
+        """Return an array of shape (len(percentiles), checkpoints)."""
+        cdf = np.cumsum(self.counts, axis=1)
+        total = cdf[:, -1]
+        rows = np.arange(cdf.shape[0])
+        width = self.edges[1] - self.edges[0]
+
+        out = np.empty((len(percentiles), cdf.shape[0]))
+        for k, q in enumerate(percentiles):
+            target = q / 100.0 * total
+            pos = (cdf < target[:, None]).sum(axis=1)
+            np.clip(pos, 0, cdf.shape[1] - 1, out=pos)
+            below = np.where(pos > 0, cdf[rows, pos - 1], 0)
+            inside = np.maximum(self.counts[rows, pos], 1)
+            out[k] = np.exp(self.edges[pos] + (target - below) / inside * width)
+        return out
+
+
+def simulate_checkpoints(p0, mu, sigma, L, weights, days, paths, step="weekly", dist="normal", df=5,
+                         method="paths", memory_mb=256, sketch_bounds=None, rng=None, precision="float64",
+                         antithetic=False):
+    """
+    Weighted portfolio value of every path at the horizon and at the checkpoint days.
+
+    Like simulate_terminal, paths and time steps are walked in memory-bounded
+    blocks keeping only the running log-price per path and asset. Time steps
+    are single days, or with method="exact" and normal shocks the gaps
+    between checkpoints, which gives the same distribution at the checkpoints
+    from far fewer draws.
+
+    Returns (final_values, checkpoint_values): the float64 value at the
+    horizon for every path, and a (paths, checkpoints) float32 array, or a
+    QuantileSketch of it when sketch_bounds=(lo, hi) is given.
+
+    precision="float32" draws, correlates and exponentiates the shocks in
+    single precision in two buffers re-used by all blocks; the running
+    log-prices and the final values stay in float64. antithetic=True pairs
+    every path with one driven by the negated shocks.
+    """
+    n = len(p0)
+    dt = 1.0 / 252.0
+    drift = (mu - 0.5 * sigma * sigma) * dt
+    scale = sigma * np.sqrt(dt)
+    points = checkpoint_days(days, step)
+    scaled_L = scale[:, None] * L
+    scaled_L_t = scaled_L.T.astype(precision)
+    start_values = (weights * p0).astype(precision)
+
+    exact = method == "exact" and dist == "normal"
+    lengths = np.diff(points, prepend=0) if exact else np.ones(days, dtype=int)
+    ends = np.cumsum(lengths)
+    path_block, step_block = block_sizes(paths, len(lengths), n, memory_mb, precision, antithetic)
+    rng, chi_rng = block_rng(rng, precision, dist)
+    if rng is not None:
+        shock_buffer = BlockBuffer(path_block * step_block * n, precision)
+        log_buffer = BlockBuffer(path_block * step_block * n, precision)
+
+    finals = np.empty(paths)
+    if sketch_bounds is None:
+        out = np.empty((paths, len(points)), dtype=np.float32)
+        profiling.count("bytes", finals.nbytes + out.nbytes)
+    else:
+        out = QuantileSketch(len(points), *sketch_bounds)
+        profiling.count("bytes", finals.nbytes + out.counts.nbytes)
+
+    for start in range(0, paths, path_block):
+        stop = min(start + path_block, paths)
+        log_price = np.zeros((stop - start, n))
+        values = np.empty((stop - start, len(points)), dtype=np.float32)
+
+        for s0 in range(0, len(lengths), step_block):
+            s1 = min(s0 + step_block, len(lengths))
+            d0, d1 = ends[s0] - lengths[s0], ends[s1 - 1]
+            shape = (drawn_paths(stop - start, antithetic), s1 - s0, n)
+            if rng is None:
+                Z = draw_shocks(shape, dist, df)
+            else:
+                Z = draw_shocks(shape, dist, df, rng, shock_buffer.view(shape), chi_rng)
+            if exact:
+                Z *= np.sqrt(lengths[s0:s1])[None, :, None]
+            np.cumsum(Z, axis=1, out=Z)
+
+            # Log-prices at the checkpoints that fall inside this block of steps
+            inside = np.flatnonzero((points > d0) & (points <= d1))
+            if inside.size:
+                pos = np.searchsorted(ends, points[inside]) - s0
+                picked = Z if len(pos) == s1 - s0 else Z[:, pos, :]
+                for rows, sign, count in antithetic_rows(stop - start, antithetic):
+                    part = picked[:count].reshape(-1, n)
+                    if rng is None:
+                        log_at = part @ (sign * scaled_L_t)
+                    else:
+                        log_at = np.matmul(part, sign * scaled_L_t, out=log_buffer.view(part.shape))
+                    log_at = log_at.reshape(count, len(pos), n)
+                    log_at += log_price[rows][:, None, :]
+                    log_at += (points[inside] - d0)[:, None] * drift
+                    values[rows, inside] = np.exp(log_at, out=log_at) @ start_values
+
+            for rows, sign, count in antithetic_rows(stop - start, antithetic):
+                log_price[rows] += (d1 - d0) * drift + sign * (Z[:count, -1, :] @ scaled_L.T)
+
+        finals[start:stop] = (weights * p0 * np.exp(log_price)).sum(axis=1)
+        if sketch_bounds is None:
+            out[start:stop] = values
+        else:
+            out.update(values)
+    return finals, out
+
+
+def simulate_horizons(p0, mu, sigma, L, weights, days, paths, scenarios, method="paths", memory_mb=256,
+                      rng=None, antithetic=False):
+    """
+    Weighted portfolio value of every path at every horizon in `days`, for
+    several scenarios from one set of shocks.
+
+    A scenario is a dict with the distribution "dist" ("normal" or "t"),
+    "df" for Student-t, "vol", a factor on sigma, and "drift", added to mu.
+    All scenarios are driven by the same normal draws, and the Student-t
+    scenarios with one df also share their chi-square draws (common random
+    numbers), so the differences between scenarios are not buried in
+    sampling noise. Paths and days are walked in memory-bounded blocks as in
+    simulate_terminal, and the blocks stop at every horizon to record the
+    values there. With method="exact" and only normal scenarios the steps
+    are the gaps between horizons instead of single days.
+
+    Returns a (scenarios, horizons, paths) array.
+    """
+    n = len(p0)
+    dt = 1.0 / 252.0
+    days = np.asarray(days)
+    vol = np.array([s.get("vol", 1.0) for s in scenarios])[:, None] * sigma
+    drift = (mu + np.array([s.get("drift", 0.0) for s in scenarios])[:, None] - 0.5 * vol * vol) * dt
+    scale = vol * np.sqrt(dt)
+    start_values = weights * p0
+
+    # One set of shock sums per distinct distribution: "normal", or the df of a Student-t
+    shocks = ["normal" if s["dist"] == "normal" else float(s["df"]) for s in scenarios]
+    dfs = sorted({d for d in shocks if d != "normal"})
+
+    exact = method == "exact" and not dfs
+    lengths = np.diff(days, prepend=0) if exact else np.ones(days[-1], dtype=int)
+    ends = np.cumsum(lengths)
+    stops = np.searchsorted(ends, days) + 1
+    path_block, step_block = block_sizes(paths, len(lengths), n, memory_mb, "float64", antithetic)
+    rng, _ = block_rng(rng, "float64", "t" if dfs else "normal")
+    chi_rngs = dict(zip(dfs, rng.spawn(len(dfs)))) if dfs else {}
+
+    out = np.empty((len(scenarios), len(days), paths))
+    profiling.count("bytes", out.nbytes)
+    for start in range(0, paths, path_block):
+        stop = min(start + path_block, paths)
+        log_price = np.zeros((len(scenarios), stop - start, n))
+
+        s0 = 0
+        for h, s_end in enumerate(stops):
+            while s0 < s_end:
+                s1 = min(s0 + step_block, s_end)
+                shape = (drawn_paths(stop - start, antithetic), s1 - s0, n)
+                Z = draw_shocks(shape, rng=rng)
+                if exact:
+                    Z *= np.sqrt(lengths[s0:s1])[None, :, None]
+
+                # Summed and correlated once per distribution, then shared by its scenarios
+                sums = {}
+                if "normal" in shocks:
+                    sums["normal"] = Z.sum(axis=1) @ L.T
+                for df in dfs:
+                    chi = chi_rngs[df].standard_gamma(df / 2, size=shape[:-1] + (1,))
+                    sums[df] = (Z / np.sqrt(chi * (2.0 / (df - 2)))).sum(axis=1) @ L.T
+
+                length = ends[s1 - 1] - ends[s0] + lengths[s0]
+                for k, key in enumerate(shocks):
+                    moves = scale[k] * sums[key]
+                    for rows, sign, count in antithetic_rows(stop - start, antithetic):
+                        log_price[k, rows] += length * drift[k] + sign * moves[:count]
+                s0 = s1
+
+            out[:, h, start:stop] = np.exp(log_price) @ start_values
+    return out
+
+
+def merge_horizon_runs(parts):
+    """Merge the (scenarios, horizons, paths) results of run_chunked along the paths."""
+    return np.concatenate(parts, axis=-1)
+
+
+def run_chunked(engine, paths, seed=None, workers=1, merge=np.concatenate, **kwargs):
+    """
+    Run a simulation engine over CHUNK_PATHS-sized chunks of paths.
+
+    Every chunk gets its own Generator spawned from SeedSequence(seed), and
+    the chunks run in a pool of `workers` processes. The partial results
+    are combined with `merge` in chunk order, so for a given seed the
+    output does not depend on the number of workers.
+    """
+    sizes = [min(CHUNK_PATHS, paths - start) for start in range(0, paths, CHUNK_PATHS)]
+    streams = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(engine, size, stream, kwargs) for size, stream in zip(sizes, streams)]
+
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            parts = list(pool.map(_run_chunk, jobs))
+    else:
+        parts = [_run_chunk(job) for job in jobs]
+    return merge(parts)
+
+
+def _run_chunk(job):
+    engine, size, stream, kwargs = job
+    return engine(paths=size, rng=np.random.default_rng(stream), **kwargs)
+
+
+def merge_checkpoint_runs(parts):
+    """Merge the (final_values, checkpoint_values) results of run_chunked."""
+    finals = np.concatenate([part[0] for part in parts])
+    if isinstance(parts[0][1], QuantileSketch):
+        checkpoints = parts[0][1]
+        for part in parts[1:]:
+            checkpoints.merge(part[1])
+    else:
+        checkpoints = np.concatenate([part[1] for part in parts])
+    return finals, checkpoints
+
+
+def batch_estimates(final_values, batch):
+    """
+    The terminal statistics of every batch of `batch` consecutive paths, as
+    {name: array of one estimate per batch}, or None with fewer than two
+    batches. Batches are even, so antithetic pairs stay together; for
+    Sobol runs one batch is one scramble.
+    """
+    k = len(final_values) // batch
+    if k < 2:
+        return None
+    parts = np.asarray(final_values[:k * batch]).reshape(k, batch)
+    names = ["p025", "var5", "p25", "p50", "p75", "p95", "p975"]
+    estimates = dict(zip(names, np.percentile(parts, [2.5, 5, 25, 50, 75, 95, 97.5], axis=1)))
+    estimates["es5"] = np.array([p[p <= v].mean() for p, v in zip(parts, estimates["var5"])])
+    estimates["mean"] = parts.mean(axis=1)
+    return estimates
+
+
+def batch_errors(final_values, batch):
+    """
+    Standard errors of the terminal statistics by batch means: the spread
+    of the per-batch statistics gives the standard error of the estimate
+    from all paths.
+    """
+    estimates = batch_estimates(final_values, batch)
+    if estimates is None:
+        return None
+    return {key: float(v.std(ddof=1) / np.sqrt(len(v))) for key, v in estimates.items()}
+
+
+def paired_errors(values, base, batch, names=("mean", "var5", "es5")):
+    """
+    Standard errors of the differences between the statistics of two sets
+    of final values simulated from the same shocks. The differences are
+    taken batch by batch, so the noise the two share cancels.
+    """
+    a, b = batch_estimates(values, batch), batch_estimates(base, batch)
+    if a is None:
+        return None
+    return {key: float((a[key] - b[key]).std(ddof=1) / np.sqrt(len(a[key]))) for key in names}
+
+
+def shock_control(finals, p0, mu, sigma, days, weights):
+    """
+    Control variate for the final portfolio values: the value-weighted sum
+    of the shock part of every asset's log-return. It is strongly correlated
+    with the final value and has mean zero for normal and Student-t shocks.
+    """
+    dt = 1.0 / 252.0
+    shock_part = np.log(finals / p0) - (mu - 0.5 * sigma * sigma) * dt * days
+    return shock_part @ (weights * p0)
@@ -0,0 +1,112 @@
+import numpy as np
+
+TRADING_DAYS = 252
+
+# Rolling windows in days offered in the menu, computed together
+STANDARD_WINDOWS = (5, 30, 90)
+
+# Share of a window's days that must have a return; the others can be holidays of another market
+MIN_WINDOW_FRACTION = 0.75
+
+# Persistence grid searched by the GARCH(1,1) fit: alpha and alpha + beta
+GARCH_ALPHAS = (0.02, 0.04, 0.06, 0.08, 0.10, 0.13, 0.16, 0.20)
+GARCH_PERSISTENCE = (0.90, 0.94, 0.97, 0.985, 0.995)
+
+
+def rolling_std(returns, windows, min_fraction=1.0):
+    """
+    Rolling sample standard deviation of every column of a (T, N) returns
+    matrix, for every window at once. It is built from cumulative sums, so
+    each window costs the same whatever its length. Missing (NaN) returns
+    are left out; a window with fewer than min_fraction of its days
+    present gives NaN, by default any gap as in pandas.
+    Returns {window: (T, N)}.
+    """
+    returns = np.asarray(returns, dtype=float)
+    T, N = returns.shape
+    valid = np.isfinite(returns)
+
+    # Centre every column first so the sums of squares do not lose precision
+    counts = valid.sum(axis=0)
+    centre = np.where(valid, returns, 0.0).sum(axis=0) / np.maximum(counts, 1)
+    x = np.where(valid, returns - centre, 0.0)
+
+    zeros = np.zeros((1, N))
+    s1 = np.concatenate([zeros, np.cumsum(x, axis=0)])
+    s2 = np.concatenate([zeros, np.cumsum(x * x, axis=0)])
+    n = np.concatenate([zeros, np.cumsum(valid, axis=0)])
+
+    result = {}
+    for w in windows:
+        out = np.full((T, N), np.nan)
+        if 1 < w <= T:
+            count = n[w:] - n[:-w]
+            enough = count >= max(2, int(np.ceil(min_fraction * w)))
+            c = np.maximum(count, 2)
+            total = s1[w:] - s1[:-w]
+            var = (s2[w:] - s2[:-w] - total * total / c) / (c - 1)
+            out[w - 1:] = np.where(enough, np.sqrt(np.maximum(var, 0.0)), np.nan)
+        result[w] = out
+    return result
+
+
+def ewma_volatility(returns, lam=0.94):
+    """
+    RiskMetrics volatility: var_t = lam * var_{t-1} + (1 - lam) * r_t^2,
+    the forecast for the next day made at the close of day t.
+    """
+    returns = np.asarray(returns, dtype=float)
+    start = _sample_variance(returns)
+    return np.sqrt(_variance_recursion(returns, 0.0, 1.0 - lam, lam, start))
+
+
+def garch_volatility(returns):
+    """
+    GARCH(1,1) volatility, var_t = omega + alpha * r_t^2 + beta * var_{t-1},
+    fitted per column by maximum likelihood over a grid of alpha and
+    alpha + beta. omega is set by variance targeting, so the long-run
+    variance equals the sample variance. Returns (volatility, params).
+    """
+    returns = np.asarray(returns, dtype=float)
+    long_run = _sample_variance(returns)
+
+    grid = np.array([(a, p - a) for a in GARCH_ALPHAS for p in GARCH_PERSISTENCE if p > a])
+    alpha, beta = grid[:, :1], grid[:, 1:]
+    omega = long_run * (1.0 - alpha - beta)
+
+    # Log-likelihood of every grid point for every column, all in one recursion
+    var = np.broadcast_to(long_run, omega.shape).copy()
+    loglik = np.zeros(omega.shape)
+    for r in returns:
+        valid = np.isfinite(r)
+        r2 = np.where(valid, r * r, 0.0)
+        loglik -= np.where(valid, 0.5 * (np.log(var) + r2 / var), 0.0)
+        var = np.where(valid, omega + alpha * r2 + beta * var, var)
+
+    best = np.argmax(loglik, axis=0)
+    cols = np.arange(returns.shape[1])
+    params = {"omega": omega[best, cols], "alpha": alpha[best, 0], "beta": beta[best, 0]}
+    var = _variance_recursion(returns, params["omega"], params["alpha"], params["beta"], long_run)
+    return np.sqrt(var), params
+
+
+# var_t = omega + alpha * r_t^2 + beta * var_{t-1} per column; missing returns leave var unchanged
+def _variance_recursion(returns, omega, alpha, beta, start):
+    out = np.empty(returns.shape)
+    var = np.array(start, dtype=float)
+    for t, r in enumerate(returns):
+        valid = np.isfinite(r)
+        var = np.where(valid, omega + alpha * np.where(valid, r * r, 0.0) + beta * var, var)
+        out[t] = var
+
+    # Nothing to report before the first return of a column
+    out[np.cumsum(np.isfinite(returns), axis=0) == 0] = np.nan
+    return out
+
+
+def _sample_variance(returns):
+    valid = np.isfinite(returns)
+    counts = np.maximum(valid.sum(axis=0), 2)
+    x = np.where(valid, returns, 0.0)
+    mean = x.sum(axis=0) / counts
+    return np.where(valid, (returns - mean) ** 2, 0.0).sum(axis=0) / (counts - 1)
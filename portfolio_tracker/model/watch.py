@@ -0,0 +1,165 @@
+import csv
+import time
+from itertools import repeat
+import numpy as np
+from model.profiling import count, span
+
+
+class LiveValuation:
+    """
+    Values, gain/loss and sector and asset-class totals of the positions,
+    kept up to date one price change at a time. A tick only touches the
+    positions whose price moved and the groups they belong to, so its cost
+    depends on the number of changes and not on the size of the portfolio.
+    Prices are rounded and a price of 0 is ignored, as in summary_stats.
+    """
+
+    def __init__(self, table, quotes=None):
+        self.table = table
+        self.tickers = table.ticker.tolist()
+        self._row = {t: i for i, t in enumerate(self.tickers)}
+        self._cost = table.quantity * table.purchase_price
+
+        n = len(table)
+        self.price = np.full(n, np.nan)
+        self.value = np.zeros(n)
+        self.held = np.zeros(n, dtype=bool)
+        self.sector_totals = np.zeros(len(table.sectors))
+        self.class_totals = np.zeros(len(table.classes))
+        self.total = 0.0
+        self.cost = 0.0
+        self.priced = 0
+
+        # Changes folded in since the totals were last summed from scratch
+        self._updates = 0
+        self.ticks = 0
+
+        # The opening prices are not a tick
+        self.apply(quotes or {})
+        self.opening = self.total
+        self.ticks = 0
+
+    # Fold in new prices; only moved prices cost anything beyond finding them
+    def apply(self, quotes):
+        """
+        Return the rows whose price changed. quotes is {ticker: price} for
+        some of the positions, or a full snapshot: an array of prices in the
+        order of self.tickers, as poll_quotes gives, in which the changes are
+        found with one comparison of the whole array.
+        """
+        self.ticks += 1
+        if isinstance(quotes, dict):
+            rows, prices = [], []
+            for ticker, price in quotes.items():
+                i = self._row.get(ticker)
+                if i is not None and price is not None:
+                    rows.append(i)
+                    prices.append(price)
+            rows = np.array(rows, dtype=int)
+            prices = np.round(np.array(prices, dtype=float), 2)
+            moved = (prices > 0) & (prices != self.price[rows])
+            rows, prices = rows[moved], prices[moved]
+        else:
+            snapshot = np.round(np.asarray(quotes, dtype=float), 2)
+            rows = np.flatnonzero((snapshot > 0) & (snapshot != self.price))
+            prices = snapshot[rows]
+
+        if not len(rows):
+            return rows
+
+        with span("revalue", changes=len(rows)):
+            new = np.round(self.table.quantity[rows] * prices, 2)
+            delta = new - self.value[rows]
+            first = ~self.held[rows]
+
+            self.price[rows] = prices
+            self.value[rows] = new
+            self.held[rows] = True
+            np.add.at(self.sector_totals, self.table.sector_code[rows], delta)
+            np.add.at(self.class_totals, self.table.class_code[rows], delta)
+            self.total += float(delta.sum())
+            self.cost += float(self._cost[rows][first].sum())
+            self.priced += int(first.sum())
+
+            # Sum again from scratch once the changes outnumber the positions, so rounding cannot pile up
+            self._updates += len(rows)
+            if self._updates > len(self.table):
+                self.resync()
+        count("watch.changes", len(rows))
+        return rows
+
+    # Recompute the running totals from the values
+    def resync(self):
+        held = self.held
+        self.sector_totals = np.bincount(self.table.sector_code[held], weights=self.value[held],
+                                         minlength=len(self.table.sectors))
+        self.class_totals = np.bincount(self.table.class_code[held], weights=self.value[held],
+                                        minlength=len(self.table.classes))
+        self.total = float(self.value[held].sum())
+        self.cost = float(self._cost[held].sum())
+        self.priced = int(held.sum())
+        self._updates = 0
+
+    def snapshot(self, rows=(), top=10):
+        """
+        The dashboard state: totals, the weights per sector and asset class,
+        and the `top` largest changed positions of the last tick.
+        """
+        rows = np.asarray(rows, dtype=int)
+        if len(rows) > top:
+            rows = rows[np.argsort(-self.value[rows])[:top]]
+
+        total = self.total
+        movers = []
+        for i in rows.tolist():
+            basis = self.table.purchase_price[i]
+            movers.append({
+                "ticker": self.tickers[i],
+                "current_price": float(self.price[i]),
+                "current_value": float(self.value[i]),
+                "gain_loss": round(float((self.price[i] - basis) * self.table.quantity[i]), 2),
+                "return_pct": round(float((self.price[i] / basis - 1) * 100), 2) if basis else None,
+            })
+
+        return {
+            "tick": self.ticks,
+            "total_value": round(total, 2),
+            "change": round(total - self.opening, 2),
+            "gain_loss": round(total - self.cost, 2),
+            "priced": self.priced,
+            "positions": len(self.table),
+            "movers": movers,
+            "sector_weights": self._weights(self.sector_totals, self.table.sectors, total),
+            "class_weights": self._weights(self.class_totals, self.table.classes, total),
+        }
+
+    @staticmethod
+    def _weights(totals, labels, total):
+        if not total:
+            return {}
+        return {labels[i]: round(float(totals[i]) / total * 100, 2) for i in np.flatnonzero(totals)}
+
+
+# New quotes for the tickers every `interval` seconds, as (timestamp, prices in the order of tickers)
+def poll_quotes(portfolio, tickers, interval=5.0):
+    while True:
+        snap = portfolio.quotes_for(tickers, refresh=True)
+        prices = np.fromiter(map(snap["quotes"].get, tickers, repeat(np.nan)), dtype=float, count=len(tickers))
+        yield time.strftime("%H:%M:%S", time.localtime(snap["taken"])), prices
+        time.sleep(interval)
+
+
+# Ticks from a CSV file with time, ticker and price columns; consecutive rows with one time are one tick
+def replay_quotes(path, interval=0.0):
+    with open(path, newline="") as f:
+        stamp, quotes = None, {}
+        for row in csv.DictReader(f):
+            if quotes and row["time"] != stamp:
+                yield stamp, quotes
+                quotes = {}
+                if interval:
+                    time.sleep(interval)
+            stamp = row["time"]
+            quotes[row["ticker"].strip().upper()] = float(row["price"])
+        if quotes:
+            yield stamp, quotes
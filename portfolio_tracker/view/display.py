@@ -1,8 +1,6 @@
-import matplotlib.pyplot as plt
-import yfinance as yf
 from datetime import date
-import matplotlib
-matplotlib.use("TkAgg")
+from model.profiling import profiled
+from view.plotting import finish, pyplot
 
 
 class Display:
@@ -40,12 +38,12 @@ class Display:
             return
 
         print("\n----- Portfolio Summary -----")
-        print(f"Total portfolio value: €{stats['total_value']}\n")
+        print(f"Total portfolio value: €{stats['total_value']}")
+        print(f"Prices fetched {stats['price_age']:.0f} seconds ago\n")
 
         print("Asset breakdown:")
         for r in stats["assets"]:
-            print(f"{r['ticker']:<5} | Value: €{
-                  r['current_value']:<10} | Weight: {r['weight']}%")
+            print(f"{r['ticker']:<5} | Value: €{r['current_value']:<10} | Weight: {r['weight']}%")
 
         print("\nBy sector:")
         for sec, w in stats["sector_weights"].items():
@@ -57,21 +55,19 @@ class Display:
 
         print()
 
-    def show_price_chart(self, tickers, start_date):
+    @profiled("price_chart")
+    def show_price_chart(self, histories, start_date):
         """Plot historical prices from user-selected start date until today."""
-        if not tickers:
+        if not histories:
             print("No tickers provided.\n")
             return
 
+        plt = pyplot()
         plt.figure(figsize=(10, 5))
         end_date = date.today().strftime("%Y-%m-%d")
 
-        for t in tickers:
-            try:
-                data = yf.Ticker(t).history(start=start_date, end=end_date)
-                plt.plot(data.index, data["Close"], label=t)
-            except Exception:
-                print(f"Could not fetch data for {t}")
+        for t, data in histories.items():
+            plt.plot(data.index, data.values, label=t)
 
         plt.title(f"Historical Prices ({start_date} → {end_date})")
         plt.xlabel("Date")
@@ -79,55 +75,64 @@ class Display:
         plt.legend()
         plt.grid(True)
         plt.tight_layout()
-        plt.show(block=False)
+        finish(name="prices")
         
-    def show_volatility_chart(self, vol_dict, window):
+    @profiled("volatility_chart")
+    def show_volatility_chart(self, vol_dict, window, method="rolling", path=None, years=3):
         if not vol_dict:
             print("No volatility data available.\n")
             return
     
-        import matplotlib
-        matplotlib.use("TkAgg")
-        import matplotlib.pyplot as plt
-    
+        plt = pyplot()
         plt.figure(figsize=(12, 6))
     
-        # Keep last 3 years (252*3 trading days ≈ 756)
-        DAYS_3Y = 756
-    
+        # The model already returns the last `years` years only
         for ticker, series in vol_dict.items():
-            trimmed = series.tail(DAYS_3Y)
-            plt.plot(trimmed.index, trimmed.values, label=ticker)
+            plt.plot(series.index, series.values, label=ticker)
     
-        plt.title(f"{window}-Day Rolling Annualized Volatility (last 3 years)")
+        names = {"rolling": f"{window}-Day Rolling", "ewma": "EWMA (λ = 0.94)", "garch": "GARCH(1,1)"}
+        plt.title(f"{names[method]} Annualized Volatility (last {years:g} years)")
         plt.xlabel("Date")
         plt.ylabel("Volatility")
         plt.grid(True)
         plt.legend()
-        plt.show(block=False)
+        finish(path, "volatility")
         
-    def show_correlation_heatmap(self, corr_matrix):
+    @profiled("correlation_heatmap")
+    def show_correlation_heatmap(self, corr_matrix, path=None):
         if corr_matrix is None:
             print("Not enough data to compute correlations.\n")
             return
     
-        import matplotlib
-        matplotlib.use("TkAgg")
-        import matplotlib.pyplot as plt
-        import seaborn as sns
-    
+        plt = pyplot()
         plt.figure(figsize=(8, 6))
-        sns.heatmap(
-            corr_matrix,
-            annot=True,
-            cmap="coolwarm",
-            vmin=-1,
-            vmax=1,
-            linewidths=0.5,
-            square=True
-        )
+        try:
+            import seaborn as sns
+        except ImportError:
+            sns = None
+
+        if sns is not None:
+            sns.heatmap(
+                corr_matrix,
+                annot=True,
+                cmap="coolwarm",
+                vmin=-1,
+                vmax=1,
+                linewidths=0.5,
+                square=True
+            )
+        else:
+            # Same chart with matplotlib alone
+            labels = list(corr_matrix.columns)
+            plt.imshow(corr_matrix.values, cmap="coolwarm", vmin=-1, vmax=1)
+            plt.colorbar()
+            plt.xticks(range(len(labels)), labels)
+            plt.yticks(range(len(labels)), labels)
+            for i, row in enumerate(corr_matrix.values):
+                for j, value in enumerate(row):
+                    plt.text(j, i, f"{value:.2f}", ha="center", va="center")
     
         plt.title("Asset Correlation Heatmap (3-Year Daily Returns)")
         plt.tight_layout()
-        plt.show(block=False)
+        finish(path, "correlation")
 
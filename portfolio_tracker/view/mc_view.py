@@ -1,7 +1,7 @@
-import matplotlib.pyplot as plt
+from datetime import datetime
 import numpy as np
-import matplotlib
-matplotlib.use("TkAgg")
+from model.profiling import profiled
+from view.plotting import finish, pyplot
 
 class MonteCarloView:
 
@@ -13,13 +13,28 @@ class MonteCarloView:
         print(f"Expected Shortfall (5%): €{sim['es5']:.2f}")
         print(f"95th percentile:        €{sim['p95']:.2f}")
 
-    def show_histogram(self, sim):
+        # Monte Carlo error of the estimates, from batches of paths
+        se = sim.get("se")
+        if se:
+            print(f"Standard errors: mean ±€{se['mean']:.2f}, VaR ±€{se['var5']:.2f}, "
+                  f"ES ±€{se['es5']:.2f} ({sim['paths']:,} paths)")
+        self._show_skipped(sim)
+
+    # Positions the simulation had to leave out for lack of price history
+    @staticmethod
+    def _show_skipped(sim):
+        if sim.get("skipped"):
+            print(f"Left out, too little price history: {', '.join(sim['skipped'])}")
+
+    @profiled("histogram")
+    def show_histogram(self, sim, path=None):
         if sim is None or "final_values" not in sim:
             print("Run a simulation first.")
             return
     
         values = sim["final_values"]
     
+        plt = pyplot()
         plt.figure(figsize=(10, 5))
         plt.hist(values, bins=50, edgecolor="black", color="lightblue")
     
@@ -32,11 +47,12 @@ class MonteCarloView:
         plt.legend()
         plt.grid(True)
     
-        plt.show(block=False)   
+        finish(path, "histogram")
 
 
 
-    def show_fan_chart(self, bands):
+    @profiled("fan_chart")
+    def show_fan_chart(self, bands, path=None):
         if bands is None:
             print("Run a simulation first.")
             return
@@ -52,8 +68,10 @@ class MonteCarloView:
         p25 = np.array(bands["p25"])
         p75 = np.array(bands["p75"])
     
-        t = np.linspace(0, 15, len(p50))
+        # Checkpoint days converted to years
+        t = np.asarray(bands["days"]) / 252
     
+        plt = pyplot()
         plt.figure(figsize=(12, 6))
     
         # 95% band (lightest)
@@ -71,10 +89,66 @@ class MonteCarloView:
         # Median
         plt.plot(t, p50, color="black", linewidth=2.0, label="Median")
     
-        plt.title("15-Year Forecast Fan Chart with MC simulation")
+        plt.title(f"{t[-1]:g}-Year Forecast Fan Chart with MC simulation")
         plt.xlabel("Years")
         plt.ylabel("Portfolio Value (€)")
         plt.grid(True)
         plt.legend()
-        plt.show(block=False)
+        finish(path, "fan_chart")
+
+    # Numbered list of stored runs, newest first, the current one marked with *
+    def show_runs(self, runs, current=None):
+        if not runs:
+            print("No stored simulations yet.")
+            return
+        print("\n----- Stored simulations -----")
+        for i, h in enumerate(runs, 1):
+            p, s = h["params"], h["stats"]
+            mark = "*" if current and h["run"]["key"] == current else " "
+            when = datetime.fromtimestamp(h["created"]).strftime("%Y-%m-%d %H:%M")
+            print(f"{mark}{i:>2}. {when} | {p['dist']:<6} | {p['years']:>4g}y | {s['paths']:>7,} paths | "
+                  f"Median €{s['median']:,.2f} | VaR €{s['var5']:,.2f} | ES €{s['es5']:,.2f}")
+
+    @profiled("comparison")
+    def show_comparison(self, sim, other, path=None):
+        """Histograms of the final values of two runs on one set of bins."""
+        a, b = sim["final_values"], other["final_values"]
+        lo, hi = np.percentile(a, 0.5), np.percentile(a, 99.5)
+        lo, hi = min(lo, np.percentile(b, 0.5)), max(hi, np.percentile(b, 99.5))
+        bins = np.linspace(lo, hi, 60)
+
+        plt = pyplot()
+        plt.figure(figsize=(10, 5))
+        plt.hist(a, bins=bins, density=True, alpha=0.5, color="lightblue", edgecolor="black", label="Current run")
+        plt.hist(b, bins=bins, density=True, alpha=0.5, color="orange", edgecolor="black",
+                 label=f"Run of {datetime.fromtimestamp(other['run']['created']):%Y-%m-%d %H:%M}")
+        plt.axvline(sim["var5"], color="blue", linestyle="--", linewidth=1.5, label="VaR 5% (current)")
+        plt.axvline(other["var5"], color="red", linestyle="--", linewidth=1.5, label="VaR 5% (earlier)")
+
+        plt.title("Final Portfolio Value: current and earlier simulation")
+        plt.xlabel("Portfolio Value (€)")
+        plt.ylabel("Density")
+        plt.legend()
+        plt.grid(True)
+        finish(path, "comparison")
+
+    # One line per horizon and scenario; the last column compares with the first scenario on the same paths
+    def show_sweep(self, sweep):
+        rows = sweep["rows"]
+        base = sweep["scenarios"][0]
+        width = max(len(name) for name in sweep["scenarios"] + ["Scenario"])
+        print(f"\n----- Scenario sweep ({sweep['paths']:,} paths, the same random numbers for every scenario) -----")
+        print(f"{'Years':>5} | {'Scenario':<{width}} | {'Median':>12} | {'VaR (5%)':>12} | {'ES (5%)':>12} | VaR vs {base}")
+        for r in rows:
+            if r["scenario"] == base:
+                compare = ""
+            else:
+                se = r.get("se_delta")
+                compare = f"€{r['delta']['var5']:+,.2f}" + (f" ±€{se['var5']:,.2f}" if se else "")
+            print(f"{r['years']:>5g} | {r['scenario']:<{width}} | {self._euro(r['median']):>12} | "
+                  f"{self._euro(r['var5']):>12} | {self._euro(r['es5']):>12} | {compare}")
+        self._show_skipped(sweep)
 
+    @staticmethod
+    def _euro(value):
+        return f"€{value:,.2f}"
@@ -0,0 +1,57 @@
+import importlib.util
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from model.profiling import span
+
+# Backends that can only write files
+NON_INTERACTIVE = ("agg", "cairo", "pdf", "pgf", "ps", "svg", "template")
+
+# Backend chosen by the application, e.g. Agg for the command-line mode
+_backend = None
+
+
+def use_backend(name):
+    """Set the backend that pyplot will be loaded with."""
+    global _backend
+    _backend = name
+
+
+def pyplot():
+    """
+    Return matplotlib.pyplot, importing it on first use. The backend is the
+    one set with use_backend, else MPLBACKEND, else TkAgg when there is a
+    screen and Tk is installed, else Agg.
+    """
+    if "matplotlib.pyplot" not in sys.modules:
+        with span("import_matplotlib"):
+            import matplotlib
+            matplotlib.use(_backend or os.environ.get("MPLBACKEND") or _default_backend())
+            import matplotlib.pyplot
+    import matplotlib.pyplot as plt
+    return plt
+
+
+# Show the figure, or save it when a path is given or nothing can be shown
+def finish(path=None, name="chart"):
+    """Return the path the figure was saved to, or None when it is shown."""
+    plt = pyplot()
+    if path is None and plt.get_backend().lower() in NON_INTERACTIVE:
+        path = Path.cwd() / f"{name}-{datetime.now():%Y%m%d-%H%M%S}.png"
+        print(f"No screen available, the chart was saved to {path}")
+    with span("draw", saved=path is not None):
+        if path is None:
+            plt.show(block=False)
+            return None
+        plt.savefig(path)
+        plt.close()
+    return path
+
+
+def _default_backend():
+    if importlib.util.find_spec("tkinter") is None:
+        return "Agg"
+    if sys.platform.startswith(("win", "darwin")):
+        return "TkAgg"
+    return "TkAgg" if os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY") else "Agg"
@@ -0,0 +1,42 @@
+import sys
+
+# Move the cursor home and clear the screen
+CLEAR = "\033[H\033[J"
+
+
+class WatchView:
+
+    def __init__(self, clear=None):
+        # Redraw in place on a terminal, print one frame after the other otherwise
+        self.clear = sys.stdout.isatty() if clear is None else clear
+
+    def show_dashboard(self, state, stamp=None):
+        title = "Portfolio Watch" + (f" {stamp}" if stamp else "")
+        lines = [f"----- {title} (tick {state['tick']}) -----"]
+        lines.append(f"Total value: €{state['total_value']:,.2f}   "
+                     f"Change: €{state['change']:+,.2f}   "
+                     f"Gain/loss: €{state['gain_loss']:+,.2f}   "
+                     f"Priced: {state['priced']}/{state['positions']}")
+
+        if state["movers"]:
+            lines.append("\nChanged this tick:")
+            for r in state["movers"]:
+                pct = "" if r["return_pct"] is None else f" ({r['return_pct']:+.2f}%)"
+                lines.append(f"{r['ticker']:<6} €{r['current_price']:>10,.2f} | Value €{r['current_value']:>12,.2f}"
+                             f" | PnL €{r['gain_loss']:>+11,.2f}{pct}")
+        else:
+            lines.append("\nNo price changes this tick.")
+
+        lines.append("\nBy sector:    " + self._weights(state["sector_weights"]))
+        lines.append("By class:     " + self._weights(state["class_weights"]))
+
+        text = "\n".join(lines)
+        if self.clear:
+            sys.stdout.write(CLEAR + text + "\n")
+        else:
+            sys.stdout.write(text + "\n\n")
+        sys.stdout.flush()
+
+    @staticmethod
+    def _weights(weights):
+        return "  ".join(f"{k} {w}%" for k, w in weights.items()) or "-"